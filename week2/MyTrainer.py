@@ -6,7 +6,7 @@ setup_logger()
 
 # import some common libraries
 import numpy as np
-import os, json, cv2, random
+import os, json, cv2, random, sys
 # import some common detectron2 utilities
 from detectron2 import model_zoo
 from detectron2.engine import DefaultPredictor
@@ -19,8 +19,8 @@ from detectron2.engine import DefaultTrainer
 
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
-from detectron2.data import build_detection_test_loader
 
+sys.path.append('/home/group02/week3/code')
 from LossEvalHook import *
 
 class MyTrainer(DefaultTrainer):
@@ -32,13 +32,5 @@ class MyTrainer(DefaultTrainer):
                      
     def build_hooks(self):
         hooks = super().build_hooks()
-        hooks.insert(-1,LossEvalHook(
-            self.cfg.TEST.EVAL_PERIOD,
-            self.model,
-            build_detection_test_loader(
-                self.cfg,
-                self.cfg.DATASETS.TEST[0],
-                DatasetMapper(self.cfg,True)
-            )
-        ))
+        hooks.insert(-1, build_loss_eval_hook(self.cfg, self.model))
         return hooks
\ No newline at end of file
@@ -0,0 +1,68 @@
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from detectron2.structures import BoxMode
+
+from kitti_labels import KITTI_CLASSES, read_labels, build_annotations
+
+
+def read_annotations_loop(label_files, classes=KITTI_CLASSES):
+    # previous kitti_dataset: one split and four float() calls per object
+    annotations = []
+    for gt_file in label_files:
+        objs = []
+        with open(gt_file) as gt_f:
+            for line in gt_f:
+                gt = line.strip().split(' ')
+                objs.append({
+                    "bbox": [float(gt[4]), float(gt[5]), float(gt[6]), float(gt[7])],
+                    "bbox_mode": BoxMode.XYXY_ABS,
+                    "category_id": classes[gt[0]]
+                })
+        annotations.append(objs)
+    return annotations
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Time of parsing the KITTI object labels with the per-line loop '
+                                                 'and with the bulk parser')
+
+    parser.add_argument('--label_dir', type=str, default='/home/mcv/datasets/KITTI/training/label_2',
+                        help='folder of the label .txt files (7,481 for the training set)')
+
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each parser, the best one is reported')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    label_files = sorted(glob.glob(os.path.join(args.label_dir, '*.txt')))
+
+    buffer_path = os.path.join(tempfile.mkdtemp(), 'labels.buffer')
+    read_labels(label_files, buffer_path=buffer_path)  # write the concatenated buffer
+
+    t_loop, t_bulk, t_buffer = float('inf'), float('inf'), float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        loop = read_annotations_loop(label_files)
+        t_loop = min(t_loop, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        labels = read_labels(label_files, fields=['bbox'])
+        bulk = build_annotations(labels)
+        t_bulk = min(t_bulk, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        buffered = build_annotations(read_labels(label_files, buffer_path=buffer_path, fields=['bbox']))
+        t_buffer = min(t_buffer, time.perf_counter() - start)
+
+    assert loop == bulk == buffered
+    print('{} files, {} objects'.format(len(label_files), len(labels['class_id'])))
+    print('loop {:.1f} ms, bulk {:.1f} ms ({:.1f}x), bulk from one buffer {:.1f} ms ({:.1f}x)'.format(
+        t_loop * 1e3, t_bulk * 1e3, t_loop / t_bulk, t_buffer * 1e3, t_loop / t_buffer))
@@ -1,13 +1,11 @@
 import numpy as np
-import os, json, random
+import os, sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
+sys.path.append('/home/group02/week3/code')
+from json_stream import iter_json_array
 
-def load_json_arr(json_path):
-    lines = []
-    with open(json_path, 'r') as f:
-        for line in f:
-            lines.append(json.loads(line))
-    return lines
 
 def get_class_name(class_id):
     classes = {
@@ -25,7 +23,7 @@ def get_class_name(class_id):
     return classes.get(class_id)
 
 
-def results_kitti(split_path,coco_results_path,kitti_results_path):
+def results_kitti(split_path,coco_results_path,kitti_results_path,num_threads=0):
     '''
     Car 0.00 0 -1.69 652.16 179.52 699.38 216.18 1.38 1.49 3.32 2.56 1.66 29.10 -1.60
     #Values    Name      Description
@@ -46,6 +44,9 @@ def results_kitti(split_path,coco_results_path,kitti_results_path):
        1    rotation_y   Rotation ry around Y-axis in camera coordinates [-pi..pi]
        1    score        Only for results: Float, indicating confidence in
                          detection, needed for p/r curves, higher is better.
+
+    Every file of the split is written once, empty if it has no detections.
+    num_threads > 1 writes them from a thread pool.
     '''
     os.makedirs(kitti_results_path, exist_ok=True)
     split_file = split_path
@@ -54,23 +55,47 @@ def results_kitti(split_path,coco_results_path,kitti_results_path):
         for line in split_f:
             dataset_list.append(line.strip())
 
-    coco_results_json = load_json_arr(coco_results_path+'coco_instances_results.json')
+    # one pass over the detections, keeping only their columns in compact arrays
+    image_ids, category_ids, bboxes, scores = array('q'), array('q'), array('d'), array('d')
+    for detection in iter_json_array(coco_results_path+'coco_instances_results.json'):
+        image_ids.append(detection['image_id'])
+        category_ids.append(detection['category_id'])
+        bboxes.extend(detection['bbox'])
+        scores.append(detection['score'])
 
-    for detection in coco_results_json[0]:
-        image_id = detection['image_id']
-        image_filename = dataset_list[image_id]
+    # detections grouped by image, in their order in the results
+    image_ids = np.frombuffer(image_ids, dtype=np.int64)
+    order = np.argsort(image_ids, kind='stable')
+    sorted_ids = image_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(sorted_ids) else np.empty(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(order)]
 
-        detection_type = get_class_name(detection['category_id'])
-        bbox_left = detection['bbox'][0]
-        bbox_top = detection['bbox'][1]
-        bbox_width = detection['bbox'][2]
-        bbox_height = detection['bbox'][3]
-        confidence = detection['score']
-    
-        result = "{} -1 -1 -10 {} {} {} {} -1 -1 -1 -1 -1 -1 -1 {}\n".format(detection_type,bbox_left,bbox_top,bbox_left+bbox_width,bbox_top+bbox_height,confidence)
-        f = open(kitti_results_path+image_filename, "a+")
-        f.write(result)
-        f.close()
+    bboxes = np.frombuffer(bboxes, dtype=np.float64).reshape(-1, 4)
+    lefts, tops = bboxes[:, 0].tolist(), bboxes[:, 1].tolist()
+    rights, bottoms = (bboxes[:, 0] + bboxes[:, 2]).tolist(), (bboxes[:, 1] + bboxes[:, 3]).tolist()
+    order = order.tolist()
+    class_names = {class_id: get_class_name(class_id) for class_id in set(category_ids)}
+
+    # every image of the split gets its file, rewritten from scratch so that reruns do not append
+    contents = {image_filename: '' for image_filename in dataset_list}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        image_filename = dataset_list[int(sorted_ids[start])]
+        contents[image_filename] = ''.join(
+            "{} -1 -1 -10 {} {} {} {} -1 -1 -1 -1 -1 -1 -1 {}\n".format(
+                class_names[category_ids[i]], lefts[i], tops[i], rights[i], bottoms[i], scores[i])
+            for i in order[start:end])
+
+    def write(item):
+        image_filename, content = item
+        with open(kitti_results_path+image_filename, 'w') as f:
+            f.write(content)
+
+    if num_threads > 1:
+        with ThreadPoolExecutor(num_threads) as pool:
+            list(pool.map(write, contents.items()))
+    else:
+        for item in contents.items():
+            write(item)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from kitti_labels import KITTI_CLASSES, read_labels
+
+# evaluated classes, their neighboring class (neither a true nor a false
+# positive) and the minimum 2D overlap of a true positive, as in the devkit
+CLASSES = ['Car', 'Pedestrian', 'Cyclist']
+NEIGHBOR_CLASSES = {'Car': 'Van', 'Pedestrian': 'Person_sitting', 'Cyclist': None}
+MIN_OVERLAP = {'Car': 0.7, 'Pedestrian': 0.5, 'Cyclist': 0.5}
+
+DIFFICULTIES = ['Easy', 'Moderate', 'Hard']
+MIN_HEIGHT = [40, 25, 25]
+MAX_OCCLUSION = [0, 1, 2]
+MAX_TRUNCATION = [0.15, 0.3, 0.5]
+
+N_SAMPLE_PTS = 41
+
+# the results written by coco_to_kitti name unknown classes 'None'
+RESULT_CLASSES = dict(KITTI_CLASSES, **{'None': -1})
+
+
+def box_overlap(boxes, query_boxes, criterion=-1):
+    '''
+    (N, K) overlaps of two sets of left, top, right, bottom boxes: IoU with
+    criterion -1, intersection over the area of boxes with criterion 0.
+    '''
+    iw = np.minimum(boxes[:, None, 2], query_boxes[None, :, 2]) - np.maximum(boxes[:, None, 0], query_boxes[None, :, 0])
+    ih = np.minimum(boxes[:, None, 3], query_boxes[None, :, 3]) - np.maximum(boxes[:, None, 1], query_boxes[None, :, 1])
+    inter = np.where((iw > 0) & (ih > 0), iw * ih, 0.0)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if criterion == -1:
+        query_areas = (query_boxes[:, 2] - query_boxes[:, 0]) * (query_boxes[:, 3] - query_boxes[:, 1])
+        union = areas[:, None] + query_areas[None, :] - inter
+    else:
+        union = np.broadcast_to(areas[:, None], inter.shape)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=inter > 0)
+
+
+def _match(overlaps, ignored_gt, ignored_det, scores, eligible, min_overlap, compute_fp):
+    '''
+    Greedy assignment of the devkit for one image. Without compute_fp every
+    ground truth takes the best scored detection above min_overlap and the
+    scores of the true positives are returned; with compute_fp it takes the
+    most overlapping one among the eligible detections and (tp, fn, assigned)
+    are returned.
+    '''
+    num_det = len(ignored_det)
+    assigned = [False] * num_det
+    tp, fn = 0, 0
+    tp_scores = []
+    for i, ignored in enumerate(ignored_gt):
+        if ignored == -1:
+            continue
+        column = overlaps[i]
+        det_idx = -1
+        if not compute_fp:
+            best = None
+            for j in range(num_det):
+                if ignored_det[j] != -1 and not assigned[j] and column[j] > min_overlap \
+                        and (best is None or scores[j] > best):
+                    det_idx, best = j, scores[j]
+        else:
+            best = 0.0
+            assigned_ignored_det = False
+            for j in range(num_det):
+                if ignored_det[j] == -1 or assigned[j] or not eligible[j] or column[j] <= min_overlap:
+                    continue
+                if ignored_det[j] == 0 and (column[j] > best or assigned_ignored_det):
+                    det_idx, best, assigned_ignored_det = j, column[j], False
+                elif ignored_det[j] == 1 and det_idx == -1:
+                    det_idx, assigned_ignored_det = j, True
+
+        if det_idx == -1:
+            if ignored == 0:
+                fn += 1
+            continue
+        assigned[det_idx] = True
+        if ignored == 0 and ignored_det[det_idx] == 0:
+            tp += 1
+            tp_scores.append(scores[det_idx])
+
+    if not compute_fp:
+        return tp_scores
+    return tp, fn, assigned
+
+
+def _image_statistics(gt_class, truncated, occluded, gt_boxes, det_class, det_boxes, scores):
+    '''
+    Statistics of one image for every evaluated class and difficulty:
+    (number of valid ground truths, scores of the true positives, scores of
+    the detections taking part sorted in decreasing order, (m + 1, 3) table
+    of tp, fp, fn when only the m best scored of them are kept).
+    '''
+    heights = gt_boxes[:, 3] - gt_boxes[:, 1]
+    det_heights = det_boxes[:, 3] - det_boxes[:, 1]
+    dc_boxes = gt_boxes[gt_class == KITTI_CLASSES['DontCare']]
+    # (num gt, num det) as the devkit loops over the ground truths
+    overlaps = box_overlap(gt_boxes, det_boxes)
+    dc_overlaps = box_overlap(det_boxes, dc_boxes, 0).max(axis=1) if len(dc_boxes) else np.zeros(len(det_boxes))
+
+    stats = {}
+    for class_name in CLASSES:
+        class_id = KITTI_CLASSES[class_name]
+        neighbor_id = KITTI_CLASSES.get(NEIGHBOR_CLASSES[class_name], -2)
+        min_overlap = MIN_OVERLAP[class_name]
+        valid_class = np.where(gt_class == class_id, 1, np.where(gt_class == neighbor_id, 0, -1))
+
+        for d in range(len(DIFFICULTIES)):
+            ignore = (occluded > MAX_OCCLUSION[d]) | (truncated > MAX_TRUNCATION[d]) | (heights <= MIN_HEIGHT[d])
+            ignored_gt = np.where((valid_class == 1) & ~ignore, 0,
+                                  np.where((valid_class == 0) | ((valid_class == 1) & ignore), 1, -1))
+            # as in the devkit, detections of any class lower than the minimum height are ignored
+            # (they can hide a ground truth) and those of other classes do not take part otherwise
+            small = det_heights < MIN_HEIGHT[d]
+            det_idx = np.flatnonzero(small | (det_class == class_id))
+
+            ignored_det = small[det_idx].astype(np.int64).tolist()
+            det_scores = scores[det_idx].tolist()
+            rows = overlaps[:, det_idx].tolist()
+            in_dc = (dc_overlaps[det_idx] > min_overlap).tolist()
+            ignored_gt_l = ignored_gt.tolist()
+
+            tp_scores = _match(rows, ignored_gt_l, ignored_det, det_scores, None, min_overlap, False)
+
+            # rank of every detection (kept in file order for the matching) by decreasing score
+            order = np.argsort(-scores[det_idx], kind='stable')
+            sorted_scores = scores[det_idx][order].tolist()
+            rank = np.empty(len(det_idx), dtype=np.int64)
+            rank[order] = np.arange(len(det_idx))
+            table = np.zeros((len(det_idx) + 1, 3), dtype=np.int64)
+            for m in range(len(det_idx) + 1):
+                if 0 < m < len(det_idx) and sorted_scores[m] == sorted_scores[m - 1]:
+                    continue  # a threshold never splits detections with the same score
+                eligible = (rank < m).tolist()
+                tp, fn, assigned = _match(rows, ignored_gt_l, ignored_det, det_scores, eligible, min_overlap, True)
+                fp = sum(1 for k in range(len(det_idx))
+                         if eligible[k] and not assigned[k] and ignored_det[k] == 0 and not in_dc[k])
+                table[m] = tp, fp, fn
+            stats[class_name, d] = (int((ignored_gt == 0).sum()), tp_scores, sorted_scores, table)
+    return stats
+
+
+def _evaluate_chunk(label_files, result_files):
+    gt = read_labels(label_files, fields=['truncated', 'occluded', 'bbox'])
+    det = read_labels(result_files, RESULT_CLASSES, fields=['bbox', 'score'])
+    chunk = {key: [0, [], [], [], []] for key in ((c, d) for c in CLASSES for d in range(len(DIFFICULTIES)))}
+    for i in range(len(label_files)):
+        g = slice(gt['offsets'][i], gt['offsets'][i + 1])
+        r = slice(det['offsets'][i], det['offsets'][i + 1])
+        stats = _image_statistics(gt['class_id'][g], gt['truncated'][g], gt['occluded'][g], gt['bbox'][g],
+                                  det['class_id'][r], det['bbox'][r], det['score'][r])
+        for key, (num_gt, tp_scores, scores, table) in stats.items():
+            entry = chunk[key]
+            entry[0] += num_gt
+            entry[1].extend(tp_scores)
+            entry[2].append(np.asarray(scores, dtype=np.float64))
+            entry[3].append(table)
+    return chunk
+
+
+def get_thresholds(scores, num_gt, num_sample_pts=N_SAMPLE_PTS):
+    # scores of the true positives closest to num_sample_pts equally spaced recalls
+    scores = np.sort(scores)[::-1]
+    current_recall = 0
+    thresholds = []
+    for i, score in enumerate(scores):
+        l_recall = (i + 1) / num_gt
+        r_recall = (i + 2) / num_gt if i < len(scores) - 1 else l_recall
+        if r_recall - current_recall < current_recall - l_recall and i < len(scores) - 1:
+            continue
+        thresholds.append(score)
+        current_recall += 1 / (num_sample_pts - 1.0)
+    return thresholds
+
+
+def average_precision(num_gt, tp_scores, scores, tables):
+    '''
+    AP with 40 recall points (and the former 11 points) of a class and
+    difficulty, from the statistics of all the images.
+    '''
+    if num_gt == 0:
+        return float('nan'), float('nan')
+    thresholds = get_thresholds(np.asarray(tp_scores), num_gt)
+
+    # per image statistics for each threshold: row of the table with the detections scored >= threshold
+    counts = np.array([len(s) for s in scores], dtype=np.int64)
+    image_index = np.repeat(np.arange(len(scores)), counts)
+    flat_scores = np.concatenate(scores) if scores else np.zeros(0)
+    table_offsets = np.concatenate([[0], np.cumsum(counts + 1)[:-1]]).astype(np.int64)
+    flat_tables = np.concatenate(tables) if tables else np.zeros((0, 3), dtype=np.int64)
+
+    precision = np.zeros(N_SAMPLE_PTS)
+    for t, threshold in enumerate(thresholds):
+        kept = np.bincount(image_index[flat_scores >= threshold], minlength=len(scores))
+        tp, fp, fn = flat_tables[table_offsets + kept].sum(axis=0)
+        precision[t] = tp / (tp + fp) if tp + fp else 0.0
+    for t in range(len(thresholds)):
+        precision[t] = precision[t:].max()
+
+    ap_r40 = precision[1:].sum() / (N_SAMPLE_PTS - 1) * 100
+    ap_r11 = precision[::4].sum() / 11 * 100
+    return float(ap_r40), float(ap_r11)
+
+
+def evaluate(split_file, label_dir, results_dir, num_workers=os.cpu_count(), chunk_size=200):
+    '''
+    KITTI 2D detection AP of the result files of a split, for Car,
+    Pedestrian and Cyclist at the Easy, Moderate and Hard difficulties.
+    Returns {class: {difficulty: {"AP_R40", "AP_R11"}}}.
+    '''
+    with open(split_file) as f:
+        names = [line.strip() for line in f if line.strip()]
+    label_files = [os.path.join(label_dir, name) for name in names]
+    result_files = [os.path.join(results_dir, name) for name in names]
+    chunks = [(label_files[i:i + chunk_size], result_files[i:i + chunk_size]) for i in range(0, len(names), chunk_size)]
+
+    if num_workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(num_workers) as pool:
+            results = list(pool.map(_evaluate_chunk, *zip(*chunks)))
+    else:
+        results = [_evaluate_chunk(*chunk) for chunk in chunks]
+
+    report = {}
+    for class_name in CLASSES:
+        report[class_name] = {}
+        for d, difficulty in enumerate(DIFFICULTIES):
+            entries = [chunk[class_name, d] for chunk in results]
+            ap_r40, ap_r11 = average_precision(
+                sum(e[0] for e in entries),
+                [s for e in entries for s in e[1]],
+                [s for e in entries for s in e[2]],
+                [t for e in entries for t in e[3]])
+            report[class_name][difficulty] = {'AP_R40': ap_r40, 'AP_R11': ap_r11}
+    return report
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='KITTI 2D detection AP of results exported by coco_to_kitti')
+
+    parser.add_argument('--split', type=str, default='/home/mcv/datasets/KITTI/test_kitti.txt',
+                        help='split file listing the label file of every image')
+
+    parser.add_argument('--labels', type=str, default='/home/mcv/datasets/KITTI/training/label_2/',
+                        help='folder of the ground truth label files')
+
+    parser.add_argument('--results', type=str, required=True,
+                        help='folder of the result files, one per image of the split')
+
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes the images are split between')
+
+    parser.add_argument('--output', type=str, default=None,
+                        help='JSON report, results/../kitti_eval.json by default')
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = evaluate(args.split, args.labels, args.results, args.workers)
+
+    print('{:>12} {:>10} {:>10} {:>10}'.format('AP_R40', *DIFFICULTIES))
+    for class_name, aps in report.items():
+        print('{:>12} {:>10.2f} {:>10.2f} {:>10.2f}'.format(class_name, *[aps[d]['AP_R40'] for d in DIFFICULTIES]))
+
+    output = args.output or os.path.join(os.path.dirname(os.path.normpath(args.results)), 'kitti_eval.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('[INFO] Report written to ' + output)
@@ -0,0 +1,161 @@
+import io
+import json
+import os
+
+import numpy as np
+
+from detectron2.structures import BoxMode
+
+KITTI_CLASSES = {
+    'Car' : 0,
+    'Van' : 1,
+    'Truck' : 2,
+    'Pedestrian' : 3,
+    'Person_sitting' : 4,
+    'Cyclist' : 5,
+    'Tram' : 6,
+    'Misc' : 7,
+    'DontCare' : 8
+}
+
+# fields of a label line: name, dtype, first column, number of columns
+FIELDS = [
+    ('type', 'S16', 0, 1),
+    ('truncated', 'f8', 1, 1),
+    ('occluded', 'f8', 2, 1),
+    ('alpha', 'f8', 3, 1),
+    ('bbox', 'f8', 4, 4),
+    ('dimensions', 'f8', 8, 3),
+    ('location', 'f8', 11, 3),
+    ('rotation_y', 'f8', 14, 1),
+    ('score', 'f8', 15, 1),  # only in results
+]
+
+
+def _label_dtype(fields, num_fields):
+    # structured dtype and columns of the fields parsed by np.loadtxt
+    descr = []
+    usecols = []
+    for name, dtype, column, width in FIELDS:
+        if column < num_fields and (fields is None or name in fields or name == 'type'):
+            descr.append((name, dtype, (width,)) if width > 1 else (name, dtype))
+            usecols.extend(range(column, column + width))
+    return np.dtype(descr), usecols
+
+
+def _read_files(label_files):
+    contents = []
+    for label_file in label_files:
+        with open(label_file, 'rb') as f:
+            contents.append(f.read())
+    return contents
+
+
+def _read_buffer(label_files, buffer_path):
+    '''
+    Contents of the label files, read from a single concatenated buffer
+    file when the files did not change since it was written (same paths,
+    mtimes and sizes), otherwise read from the files and saved to it.
+    '''
+    stats = []
+    for label_file in label_files:
+        st = os.stat(label_file)
+        stats.append([label_file, st.st_mtime_ns, st.st_size])
+    index_path = buffer_path + '.json'
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if index == stats:
+            with open(buffer_path, 'rb') as f:
+                data = f.read()
+            offsets = np.concatenate([[0], np.cumsum([size for _, _, size in stats])])
+            if offsets[-1] == len(data):
+                return [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    except (OSError, ValueError):
+        pass
+
+    contents = _read_files(label_files)
+    os.makedirs(os.path.dirname(buffer_path) or '.', exist_ok=True)
+    tmp = '.tmp{}'.format(os.getpid())
+    with open(buffer_path + tmp, 'wb') as f:
+        f.write(b''.join(contents))
+    with open(index_path + tmp, 'w') as f:
+        json.dump(stats, f)
+    os.replace(buffer_path + tmp, buffer_path)
+    os.replace(index_path + tmp, index_path)
+    return contents
+
+
+def read_labels(label_files, classes=KITTI_CLASSES, buffer_path=None, fields=None):
+    '''
+    Parse KITTI object label files (label_2/*.txt, or results with a score)
+    in a single pass: the files are joined into one buffer parsed at once by
+    np.loadtxt into a structured array. With buffer_path, the files are read
+    from one concatenated copy of them while they do not change. Only the
+    given fields (and the type) are parsed if fields is not None.
+
+    Returns columnar arrays with one row per object:
+
+    image       index of its file in label_files
+    type        class name (bytes)
+    class_id    classes[type]
+    truncated, occluded, alpha, rotation_y, score (if present)
+    bbox        (N, 4) left, top, right, bottom
+    dimensions  (N, 3) height, width, length
+    location    (N, 3) x, y, z
+
+    and 'offsets', so that the objects of file i are the rows offsets[i]:offsets[i + 1].
+    '''
+    contents = _read_buffer(label_files, buffer_path) if buffer_path else _read_files(label_files)
+    contents = [c if not c or c.endswith(b'\n') else c + b'\n' for c in contents]
+    data = b''.join(contents)
+
+    first_line = data.lstrip().split(b'\n', 1)[0]
+    if first_line:
+        num_fields = len(first_line.split())
+    else:
+        num_fields = 16 if fields is not None and 'score' in fields else 15
+    if num_fields not in (15, 16):
+        raise ValueError('KITTI labels have 15 fields (16 with a score), found {}'.format(num_fields))
+    dtype, usecols = _label_dtype(fields, num_fields)
+
+    if first_line:
+        table = np.loadtxt(io.BytesIO(data), dtype=dtype, usecols=usecols, ndmin=1, comments=None)
+    else:
+        table = np.zeros(0, dtype=dtype)
+
+    lines_per_file = np.array([c.count(b'\n') for c in contents], dtype=np.int64)
+    if lines_per_file.sum() != len(table):
+        # blank lines, skipped by loadtxt
+        lines_per_file = np.array([sum(1 for l in c.splitlines() if l.strip()) for c in contents], dtype=np.int64)
+
+    types, inverse = np.unique(table['type'], return_inverse=True)
+    unknown = [t.decode() for t in types if t.decode() not in classes]
+    if unknown:
+        raise ValueError('Unknown KITTI classes: ' + ', '.join(unknown))
+    type_ids = np.array([classes[t.decode()] for t in types], dtype=np.int32)
+
+    labels = {name: table[name] for name in dtype.names}
+    if 'occluded' in labels:
+        labels['occluded'] = labels['occluded'].astype(np.int32)
+    labels['class_id'] = type_ids[inverse.reshape(-1)]
+    labels['image'] = np.repeat(np.arange(len(contents), dtype=np.int32), lines_per_file)
+    labels['offsets'] = np.concatenate([[0], np.cumsum(lines_per_file)]).astype(np.int64)
+    return labels
+
+
+def build_annotations(labels):
+    '''
+    detectron2 annotations of every file read by read_labels, as the
+    list of {"bbox", "bbox_mode", "category_id"} of each file.
+    '''
+    # tolist() once for all the objects instead of one conversion per value
+    bboxes = labels['bbox'].tolist()
+    class_ids = labels['class_id'].tolist()
+    offsets = labels['offsets'].tolist()
+    mode = BoxMode.XYXY_ABS
+    return [
+        [{"bbox": bbox, "bbox_mode": mode, "category_id": class_id}
+         for bbox, class_id in zip(bboxes[start:end], class_ids[start:end])]
+        for start, end in zip(offsets[:-1], offsets[1:])
+    ]
@@ -1,27 +1,26 @@
-import json
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
-experiment_folder = '/home/group02/week2/results/task_d/to_plot/faster_rcnn_R_50_FPN_3x/lr_0001/batch_size_128/'
-
-def load_json_arr(json_path):
-    lines = []
-    with open(json_path, 'r') as f:
-        for line in f:
-            lines.append(json.loads(line))
-    return lines
+sys.path.append('/home/group02/week3/code')
+from json_stream import iter_json_lines
 
-experiment_metrics = load_json_arr(experiment_folder + 'metrics.json')
+experiment_folder = '/home/group02/week2/results/task_d/to_plot/faster_rcnn_R_50_FPN_3x/lr_0001/batch_size_128/'
 
+# single pass over the metrics: the losses are kept from the record after the first validation
 train_loss = {}
-flag_train = False
-for x in experiment_metrics:
-    if flag_train:
+validation_loss = {}
+seen_validation = False
+for x in iter_json_lines(experiment_folder + 'metrics.json'):
+    if seen_validation:
         if 'total_loss' in x:
                 train_loss[x['iteration']] = x['total_loss']
+        if 'validation_loss' in x:
+            # asynchronous LossEvalHook: the iteration of the evaluated weights
+            validation_loss[x.get('validation_loss_iter', x['iteration'])] = x['validation_loss']
 
     if 'validation_loss' in x:
-        flag_train = True
+        seen_validation = True
 
 x1=[]
 y1=[]
@@ -37,16 +36,6 @@ print(len(y1))
 plt.plot(x1,y1, color="blue", label="Train Loss")
 
 
-validation_loss= {}
-flag_val = False
-for x in experiment_metrics:
-    if flag_val:
-        if 'validation_loss' in x:
-            validation_loss[x['iteration']] = x['validation_loss']
-
-    if 'validation_loss' in x:
-        flag_val = True
-
 x2=[]
 y2=[]
 for k, v in validation_loss.items():
@@ -1,4 +1,4 @@
-import os, cv2
+import os, sys, cv2
 import torch
 assert torch.__version__.startswith("1.7")   # need to manually install torch 1.8 if Colab changes its default version
 from detectron2.utils.logger import setup_logger
@@ -6,12 +6,29 @@ setup_logger()
 
 # import some common detectron2 utilities
 from detectron2 import model_zoo
-from detectron2.engine import DefaultPredictor
 from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
+import argparse
+
+sys.path.append('/home/group02/week3/code')
+from batch_predictor import BatchPredictor
+from inference_manifest import MANIFEST_NAME, InferenceManifest, config_hash
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--batch_size', '--batch-size', type=int, default=1,
+                        help='number of images of the same size given to the model at once')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the images already processed with the same configuration by a previous run')
+
+    return parser.parse_args(args)
+
 if __name__ == '__main__':
+    args = parse_args()
 
     # Run a pre-trained detectron2 model
     cfg = get_cfg()
@@ -20,20 +37,20 @@ if __name__ == '__main__':
     cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
 
     cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url("COCO-Detection/faster_rcnn_X_101_32x8d_FPN_3x.yaml")
-    predictor = DefaultPredictor(cfg)
+    predictor = BatchPredictor(cfg, args.batch_size)
 
     results_dir = '../results/task_b/'
     data_path = '/home/mcv/datasets/MIT_split/'
+    os.makedirs(results_dir, exist_ok=True)
+    manifest = InferenceManifest(os.path.join(results_dir, MANIFEST_NAME), config_hash(cfg), args.resume)
+
     for subdir, dirs, files in os.walk(data_path):
         results_path = os.path.join(results_dir, subdir.split('datasets/')[1])
         os.makedirs(results_path, exist_ok=True)
-        for file in files:
-            input_path = os.path.join(subdir, file)
-            output_path = os.path.join(results_path, file)
-
-            im = cv2.imread(input_path)
-
-            outputs = predictor(im)
+        jobs = [(os.path.join(subdir, file), os.path.join(results_path, file)) for file in files]
+        input_paths = [input_path for input_path, _ in manifest.pending(jobs)]
+        for input_path, im, outputs in predictor.predict_files(input_paths):
+            output_path = os.path.join(results_path, os.path.basename(input_path))
 
             # print(outputs["instances"].pred_classes)
             # print(outputs["instances"].pred_boxes)
@@ -42,3 +59,5 @@ if __name__ == '__main__':
             v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(cfg.DATASETS.TRAIN[0]), scale=1.2)
             out = v.draw_instance_predictions(outputs["instances"].to("cpu"))
             cv2.imwrite(output_path, out.get_image()[:, :, ::-1])
+            manifest.mark_done(output_path)
+    manifest.close()
@@ -1,4 +1,4 @@
-import os, cv2
+import os, sys, cv2
 import torch
 assert torch.__version__.startswith("1.7")   # need to manually install torch 1.8 if Colab changes its default version
 from detectron2.utils.logger import setup_logger
@@ -6,13 +6,38 @@ setup_logger()
 
 # import some common detectron2 utilities
 from detectron2 import model_zoo
-from detectron2.engine import DefaultPredictor
 from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures.instances import Instances
-from detectron2.structures.boxes import Boxes
+import argparse
+
+sys.path.append('/home/group02/week3/code')
+from batch_predictor import BatchPredictor
+from inference_manifest import MANIFEST_NAME, InferenceManifest, config_hash
+from postprocess import parse_class_thresholds, postprocess
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--batch_size', '--batch-size', type=int, default=1,
+                        help='number of images of the same size given to the model at once')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the images already processed with the same configuration by a previous run')
+
+    parser.add_argument('--class_score', type=str, nargs='*', default=[],
+                        help='per class confidence thresholds as class_id:threshold, e.g. 0:0.6 2:0.4')
+
+    parser.add_argument('--topk', type=int, default=None,
+                        help='keep at most the k detections with the highest score per image')
+
+    parser.add_argument('--nms', type=float, default=None,
+                        help='IoU threshold of an extra class-aware NMS on the detections')
+
+    return parser.parse_args(args)
+
+args = parse_args()
 
 # Run a pre-trained detectron2 model
 cfg = get_cfg()
@@ -21,41 +46,29 @@ cfg.merge_from_file(model_zoo.get_config_file("COCO-Detection/retinanet_R_101_FP
 cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
 
 cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url("COCO-Detection/retinanet_R_101_FPN_3x.yaml")
-predictor = DefaultPredictor(cfg)
+predictor = BatchPredictor(cfg, args.batch_size)
 
 results_dir = '../results/task_c/'
 data_path = '/home/mcv/datasets/MIT_split/'
 
 # only detections with a confidence higher than this threshold are considered
 conf_threshold = 0.5
+class_thresh = parse_class_thresholds(args.class_score)
+
+os.makedirs(results_dir, exist_ok=True)
+manifest = InferenceManifest(os.path.join(results_dir, MANIFEST_NAME),
+                             config_hash(cfg, conf_threshold=conf_threshold, class_score=args.class_score,
+                                         topk=args.topk, nms=args.nms), args.resume)
 
 for subdir, dirs, files in os.walk(data_path):
     results_path = os.path.join(results_dir, subdir.split('datasets/')[1])
     os.makedirs(results_path, exist_ok=True)
-    for file in files:
-
-        filtered_boxes = []
-        filtered_scores = []
-        filtered_classes = []
-
-        input_path = os.path.join(subdir, file)
-        output_path = results_path+file
-
-        im = cv2.imread(input_path)
-
-        outputs = predictor(im)
-
-        pred_boxes = outputs["instances"].pred_boxes.to("cpu")
-        scores = outputs["instances"].scores.to("cpu")
-        pred_classes = outputs["instances"].pred_classes.to("cpu")
-
-        for idx, s in enumerate(scores):
-            if s.item() >= conf_threshold:
-                filtered_boxes.append(pred_boxes[idx].tensor.numpy()[0])
-                filtered_scores.append(scores[idx].item())
-                filtered_classes.append(pred_classes[idx].item())
+    jobs = [(os.path.join(subdir, file), results_path + file) for file in files]
+    input_paths = [input_path for input_path, _ in manifest.pending(jobs)]
+    for input_path, im, outputs in predictor.predict_files(input_paths):
+        output_path = results_path+os.path.basename(input_path)
 
-        filtered_outputs = Instances([256,256], pred_boxes=torch.tensor(filtered_boxes), scores=torch.tensor(filtered_scores), pred_classes=torch.tensor(filtered_classes))
+        filtered_outputs = postprocess(outputs["instances"].to("cpu"), conf_threshold, class_thresh, args.topk, args.nms)
 
         # print(outputs["instances"].pred_classes)
         # print(outputs["instances"].pred_boxes)
@@ -64,3 +77,5 @@ for subdir, dirs, files in os.walk(data_path):
         v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(cfg.DATASETS.TRAIN[0]), scale=1.2)
         out = v.draw_instance_predictions(filtered_outputs)
         cv2.imwrite(output_path, out.get_image()[:, :, ::-1])
+        manifest.mark_done(output_path)
+manifest.close()
@@ -14,14 +14,17 @@ from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures import BoxMode
 from detectron2.engine import DefaultTrainer
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
 from detectron2.data import build_detection_test_loader
 
+sys.path.append('/home/group02/week3/code')
 from LossEvalHook import *
 from MyTrainer import *
+from kitti_labels import read_labels, build_annotations
+
+from image_size import SizeIndex
 #from PlotTogether import *
 
 ### ToDo:  See how to handle the split in train, val and test. There is a txt file listing the images for each one
@@ -72,38 +75,25 @@ def kitti_dataset(dataset_type):
         for line in split_f:
             dataset_list.append(line.strip())
 
+    # all the label files of the split parsed at once into columns
+    labels = read_labels([gt_path + img_name for img_name in dataset_list], classes, fields=['bbox'])
+    annotations = build_annotations(labels)
+
     # my guess here read the split_path/[train,val,test] txt file and put it on a list
+    sizes = SizeIndex()
     for img_id, img_name in enumerate(dataset_list):#change dataset_path for read split list of files
         record = {}
 
         filename = dataset_path + img_name.replace(".txt", ".png")
-        height, width = cv2.imread(filename).shape[:2]
+        height, width = sizes.get(filename)
 
         record['file_name'] = filename
         record['image_id'] = img_id
         record['height'] = height
         record['width'] = width
-
-        gt_file = gt_path + img_name
-        objs = []
-        with open(gt_file) as gt_f:
-            for line in gt_f:
-                gt=line.strip().split(' ')
-
-                gt_type = gt[0]
-                bbox_left = float(gt[4])
-                bbox_top = float(gt[5])
-                bbox_right = float(gt[6])
-                bbox_bottom = float(gt[7])
-
-                obj = {
-                    "bbox" : [bbox_left, bbox_top, bbox_right, bbox_bottom],
-                    "bbox_mode" : BoxMode.XYXY_ABS,
-                    "category_id" : classes[gt_type]
-                }
-                objs.append(obj)
-        record['annotations'] = objs
+        record['annotations'] = annotations[img_id]
         kitti_dicts.append(record)
+    sizes.save()
 
     return kitti_dicts
 
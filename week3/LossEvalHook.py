@@ -1,70 +1,323 @@
 from detectron2.engine.hooks import HookBase
-from detectron2.evaluation import inference_context
 from detectron2.utils.logger import log_every_n_seconds
-from detectron2.data import DatasetMapper, build_detection_test_loader
+from detectron2.utils.events import EventStorage
+from detectron2.data import DatasetMapper, build_detection_test_loader, DatasetCatalog, MetadataCatalog
+from detectron2.data import transforms as T
+from detectron2.modeling import build_model
 import detectron2.utils.comm as comm
 import torch
+import torch.multiprocessing as mp
+import queue
 import time
-import datetime
 import logging
+import os
 import numpy as np
 
+
+def register_loss_eval_subset(dataset_name, num_images, seed=0):
+    '''
+    Registers a fixed random subset of num_images images of a dataset, the
+    same on every run with the same seed, and returns its name. Returns
+    dataset_name itself when num_images is 0 or covers the whole dataset.
+    '''
+    dicts = DatasetCatalog.get(dataset_name)
+    if not num_images or num_images >= len(dicts):
+        return dataset_name
+    name = '{}_loss_eval_{}_{}'.format(dataset_name, num_images, seed)
+    if name not in DatasetCatalog.list():
+        indices = np.sort(np.random.RandomState(seed).choice(len(dicts), num_images, replace=False))
+        subset = [dicts[i] for i in indices]
+        DatasetCatalog.register(name, lambda: subset)
+        thing_classes = MetadataCatalog.get(dataset_name).get('thing_classes')
+        if thing_classes is not None:
+            MetadataCatalog.get(name).set(thing_classes=thing_classes)
+    return name
+
+
+def loss_eval_mapper(cfg):
+    '''
+    DatasetMapper keeping the annotations (needed by the losses) but with
+    the deterministic test resize instead of the random train augmentations,
+    so that every pass sees the same inputs.
+    '''
+    return DatasetMapper(cfg, is_train=True, augmentations=[
+        T.ResizeShortestEdge(cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MAX_SIZE_TEST, 'choice')
+    ])
+
+
+class MappedDatasetCache:
+    '''
+    Batches of one mapped image, as given by build_detection_test_loader,
+    mapped only on the first pass and then reused. The images are kept in
+    RAM, or in a memory-mapped file if memmap_path is given, until they take
+    max_bytes; the images after that are mapped again on every pass.
+    '''
+    def __init__(self, dataset_dicts, mapper, max_bytes, memmap_path=None):
+        self._dicts = dataset_dicts
+        self._mapper = mapper
+        self._max_bytes = max_bytes
+        self._memmap_path = memmap_path
+        self._records = None
+        self._images = None
+
+    def __len__(self):
+        return len(self._dicts)
+
+    def _build(self):
+        # returns the mapped batch of the first image left out, for the first pass to use
+        records = []
+        images = []
+        nbytes = 0
+        overflow = None
+        data = None
+        f = open(self._memmap_path, 'wb') if self._memmap_path else None
+        try:
+            for d in self._dicts:
+                mapped = self._mapper(d)
+                image = mapped['image']
+                if nbytes + image.numel() > self._max_bytes:
+                    overflow = mapped
+                    break
+                del mapped['image']
+                nbytes += image.numel()
+                if f is not None:
+                    f.write(image.numpy().tobytes())
+                    images.append(image.shape)
+                else:
+                    images.append(image)
+                records.append(mapped)
+            if f is not None:
+                f.close()
+                if nbytes:
+                    # copy-on-write mapping, the tensors given to the model are writable but the file is not modified
+                    data = np.memmap(self._memmap_path, dtype=np.uint8, mode='c')
+        finally:
+            if f is not None:
+                f.close()
+                os.remove(self._memmap_path)  # a mapping stays valid, nothing is left behind
+
+        if data is not None:
+            offset = 0
+            for i, shape in enumerate(images):
+                size = int(np.prod(shape))
+                images[i] = torch.from_numpy(data[offset:offset + size].reshape(shape))
+                offset += size
+        self._records = records
+        self._images = images
+        logging.getLogger(__name__).info('Cached {} of {} validation images, {:.0f} MB in {}'.format(
+            len(records), len(self._dicts), nbytes / 2 ** 20, self._memmap_path or 'RAM'))
+        return overflow
+
+    def __iter__(self):
+        overflow = self._build() if self._records is None else None
+        for record, image in zip(self._records, self._images):
+            batch = dict(record)
+            batch['image'] = image
+            yield [batch]
+        uncached = self._dicts[len(self._records):]
+        if overflow is not None:
+            yield [overflow]
+            uncached = uncached[1:]
+        for d in uncached:
+            yield [self._mapper(d)]
+
+
+def build_loss_eval_loader(cfg, dataset_name):
+    '''
+    Validation batches of a dataset for LossEvalHook, mapped with
+    loss_eval_mapper. They are cached with MappedDatasetCache, up to
+    TEST.LOSS_EVAL_CACHE_MB MB of images (0 to map them on every pass) kept
+    in RAM or, if TEST.LOSS_EVAL_CACHE_DIR is set, in a file in that folder.
+    '''
+    mapper = loss_eval_mapper(cfg)
+    cache_mb = cfg.TEST.get('LOSS_EVAL_CACHE_MB', 2048)
+    if not cache_mb:
+        return build_detection_test_loader(cfg, dataset_name, mapper)
+    memmap_path = None
+    cache_dir = cfg.TEST.get('LOSS_EVAL_CACHE_DIR', '')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        memmap_path = os.path.join(cache_dir, '{}_{}.bin'.format(dataset_name, os.getpid()))
+    return MappedDatasetCache(DatasetCatalog.get(dataset_name), mapper, cache_mb * 2 ** 20, memmap_path)
+
+
+def compute_losses(model, data_loader):
+    '''
+    Mean training losses of the model over data_loader, computed under
+    no_grad. The losses are summed on the device and read back once at the
+    end; the compute time only counts the model calls (CUDA events on GPU).
+
+    Returns ({loss name: mean per image}, images, compute seconds)
+    '''
+    cuda = next(model.parameters()).is_cuda
+    total = len(data_loader)
+    names = None
+    sums = None
+    images = 0
+    timings = []
+    start_time = time.perf_counter()
+    with torch.no_grad():
+        for idx, inputs in enumerate(data_loader):
+            if cuda:
+                start = torch.cuda.Event(enable_timing=True)
+                end = torch.cuda.Event(enable_timing=True)
+                start.record()
+            else:
+                start = time.perf_counter()
+            loss_dict = model(inputs)
+            if names is None:
+                names = sorted(loss_dict)
+            losses = torch.stack([torch.as_tensor(loss_dict[k]).detach().float() for k in names]) * len(inputs)
+            sums = losses if sums is None else sums + losses
+            images += len(inputs)
+            if cuda:
+                end.record()
+            else:
+                end = time.perf_counter()
+            timings.append((start, end))
+
+            seconds_per_img = (time.perf_counter() - start_time) / images
+            log_every_n_seconds(
+                logging.INFO,
+                "Loss on Validation  done {}/{}. {:.4f} s / img".format(idx + 1, total, seconds_per_img),
+                n=5,
+            )
+
+    if not images:
+        return {}, 0, 0.0
+    means = (sums / images).tolist()  # the only synchronization with the device
+    if cuda:
+        compute_seconds = sum(start.elapsed_time(end) for start, end in timings) / 1e3
+    else:
+        compute_seconds = sum(end - start for start, end in timings)
+    return dict(zip(names, means)), images, compute_seconds
+
+
+def _loss_eval_worker(cfg, dataset_name, dataset_dicts, snapshots, results):
+    try:
+        DatasetCatalog.register(dataset_name, lambda: dataset_dicts)
+        model = build_model(cfg)
+        model.train()  # the model only returns its losses in training mode
+        data_loader = build_loss_eval_loader(cfg, dataset_name)
+        while True:
+            message = snapshots.get()
+            if message is None:
+                break
+            iteration, state_dict = message
+            model.load_state_dict(state_dict)
+            del state_dict
+            # in training mode the heads log to the current event storage, this one is thrown away
+            with EventStorage(iteration):
+                losses = compute_losses(model, data_loader)
+            results.put((iteration,) + losses)
+    except Exception as e:
+        results.put((None, repr(e), 0, 0.0))
+
+
 class LossEvalHook(HookBase):
-    def __init__(self, eval_period, model, data_loader):
+    '''
+    Puts the validation loss (and every loss term as validation_<term>) in
+    the EventStorage every eval_period iterations and at the end of the
+    training.
+
+    With async_eval=True the losses are computed in a separate process on a
+    CPU snapshot of the weights (cfg and dataset_name are then required), so
+    training goes on meanwhile. A result is put in the storage when it is
+    ready, with validation_loss_iter set to the iteration of its weights; a
+    period is skipped while the previous snapshot is still evaluated.
+    '''
+    def __init__(self, eval_period, model, data_loader, cfg=None, dataset_name=None, async_eval=False):
         self._model = model
         self._period = eval_period
         self._data_loader = data_loader
-    
+        self._cfg = cfg
+        self._dataset_name = dataset_name
+        self._async = async_eval
+        self._logger = logging.getLogger(__name__)
+        if async_eval and (cfg is None or dataset_name is None):
+            raise ValueError('LossEvalHook: async_eval needs the cfg and the dataset_name')
+
+    def before_train(self):
+        if self._async:
+            cfg = self._cfg.clone()
+            cfg.MODEL.DEVICE = self._cfg.TEST.get('LOSS_EVAL_DEVICE', cfg.MODEL.DEVICE)
+            cfg.MODEL.WEIGHTS = ''
+            ctx = mp.get_context('spawn')  # CUDA can not be used in forked processes
+            self._snapshots = ctx.Queue()
+            self._results = ctx.Queue()
+            self._process = ctx.Process(target=_loss_eval_worker, args=(
+                cfg, self._dataset_name, DatasetCatalog.get(self._dataset_name), self._snapshots, self._results))
+            self._process.start()
+            self._pending = False
+
+    def _put_losses(self, iteration, losses, images, seconds):
+        if not images:
+            return
+        storage = self.trainer.storage
+        storage.put_scalar('validation_loss', sum(losses.values()))
+        storage.put_scalars(**{'validation_' + k: v for k, v in losses.items()})
+        storage.put_scalar('validation_loss_iter', iteration)
+        self._logger.info('Validation loss {:.4f} of iteration {} on {} images, {:.2f}s of compute'.format(
+            sum(losses.values()), iteration, images, seconds))
+
     def _do_loss_eval(self):
-        # Copying inference_on_dataset from evaluator.py
-        total = len(self._data_loader)
-        num_warmup = min(5, total - 1)
-            
-        start_time = time.perf_counter()
-        total_compute_time = 0
-        losses = []
-        for idx, inputs in enumerate(self._data_loader):            
-            if idx == num_warmup:
-                start_time = time.perf_counter()
-                total_compute_time = 0
-            start_compute_time = time.perf_counter()
-            if torch.cuda.is_available():
-                torch.cuda.synchronize()
-            total_compute_time += time.perf_counter() - start_compute_time
-            iters_after_start = idx + 1 - num_warmup * int(idx >= num_warmup)
-            seconds_per_img = total_compute_time / iters_after_start
-            if idx >= num_warmup * 2 or seconds_per_img > 5:
-                total_seconds_per_img = (time.perf_counter() - start_time) / iters_after_start
-                eta = datetime.timedelta(seconds=int(total_seconds_per_img * (total - idx - 1)))
-                log_every_n_seconds(
-                    logging.INFO,
-                    "Loss on Validation  done {}/{}. {:.4f} s / img. ETA={}".format(
-                        idx + 1, total, seconds_per_img, str(eta)
-                    ),
-                    n=5,
-                )
-            loss_batch = self._get_loss(inputs)
-            losses.append(loss_batch)
-        mean_loss = np.mean(losses)
-        self.trainer.storage.put_scalar('validation_loss', mean_loss)
-        comm.synchronize()
-
-        return losses
-            
-    def _get_loss(self, data):
-        # How loss is calculated on train_loop 
-        metrics_dict = self._model(data)
-        metrics_dict = {
-            k: v.detach().cpu().item() if isinstance(v, torch.Tensor) else float(v)
-            for k, v in metrics_dict.items()
-        }
-        total_losses_reduced = sum(loss for loss in metrics_dict.values())
-        return total_losses_reduced
-        
-        
+        model = self._model.module if hasattr(self._model, 'module') else self._model
+        if not self._async:
+            self._put_losses(self.trainer.iter, *compute_losses(model, self._data_loader))
+            comm.synchronize()
+            return
+        if self._pending:
+            self._logger.info('Validation loss of iteration {} skipped, still evaluating the previous one'.format(
+                self.trainer.iter))
+            return
+        snapshot = {k: v.detach().to('cpu', copy=True) for k, v in model.state_dict().items()}
+        self._snapshots.put((self.trainer.iter, snapshot))
+        self._pending = True
+
+    def _poll(self, block=False):
+        while self._pending:
+            try:
+                result = self._results.get(timeout=5) if block else self._results.get_nowait()
+            except queue.Empty:
+                if not self._process.is_alive():
+                    raise RuntimeError('The validation loss process died')
+                if block:
+                    continue
+                return
+            self._pending = False
+            if result[0] is None:
+                raise RuntimeError('Validation loss failed: ' + result[1])
+            self._put_losses(*result)
+
     def after_step(self):
+        if self._async:
+            self._poll()
         next_iter = self.trainer.iter + 1
         is_final = next_iter == self.trainer.max_iter
         if is_final or (self._period > 0 and next_iter % self._period == 0):
+            if is_final and self._async:
+                self._poll(block=True)  # the final loss is always computed
             self._do_loss_eval()
-        self.trainer.storage.put_scalars(timetest=12)
\ No newline at end of file
+            if is_final and self._async:
+                self._poll(block=True)
+
+    def after_train(self):
+        if self._async:
+            self._snapshots.put(None)
+            self._process.join(timeout=60)
+            if self._process.is_alive():
+                self._process.terminate()
+
+
+def build_loss_eval_hook(cfg, model):
+    '''
+    LossEvalHook on DATASETS.TEST[0], restricted to TEST.LOSS_EVAL_IMAGES
+    random images (0 for all of them) and asynchronous if TEST.LOSS_EVAL_ASYNC.
+    The batches come from build_loss_eval_loader.
+    '''
+    dataset_name = register_loss_eval_subset(cfg.DATASETS.TEST[0], cfg.TEST.get('LOSS_EVAL_IMAGES', 0),
+                                             cfg.TEST.get('LOSS_EVAL_SEED', 0))
+    async_eval = cfg.TEST.get('LOSS_EVAL_ASYNC', False)
+    data_loader = None if async_eval else build_loss_eval_loader(cfg, dataset_name)
+    return LossEvalHook(cfg.TEST.EVAL_PERIOD, model, data_loader, cfg=cfg, dataset_name=dataset_name,
+                        async_eval=async_eval)
@@ -19,9 +19,9 @@ from detectron2.engine import DefaultTrainer
 
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
-from detectron2.data import build_detection_test_loader
 
 from LossEvalHook import *
+from ProfilerHook import build_profiler_hook
 
 class MyTrainer(DefaultTrainer):
     @classmethod
@@ -32,13 +32,9 @@ class MyTrainer(DefaultTrainer):
                      
     def build_hooks(self):
         hooks = super().build_hooks()
-        hooks.insert(-1,LossEvalHook(
-            self.cfg.TEST.EVAL_PERIOD,
-            self.model,
-            build_detection_test_loader(
-                self.cfg,
-                self.cfg.DATASETS.TEST[0],
-                DatasetMapper(self.cfg,True)
-            )
-        ))
+        hooks.insert(-1, build_loss_eval_hook(self.cfg, self.model))
+        profiler = build_profiler_hook(self.cfg, self.model)
+        if profiler is not None:
+            # first, so that the time of the other hooks is not in the profiled step
+            hooks.insert(0, profiler)
         return hooks
\ No newline at end of file
@@ -0,0 +1,204 @@
+from detectron2.engine.hooks import HookBase
+import torch
+import time
+import json
+import os
+import weakref
+
+# submodules of GeneralizedRCNN / RetinaNet timed by the profiler -> stage name.
+# Stages can be nested (roi_heads contains box_head and mask_head), they are
+# shown as nested spans in the trace.
+STAGES = [
+    ('backbone', 'backbone'),
+    ('backbone.bottom_up', 'backbone.bottom_up'),
+    ('proposal_generator', 'rpn'),
+    ('roi_heads', 'roi_heads'),
+    ('roi_heads.box_head', 'roi_heads.box_head'),
+    ('roi_heads.box_predictor', 'roi_heads.box_predictor'),
+    ('roi_heads.mask_head', 'roi_heads.mask_head'),
+    ('head', 'retina_head'),
+]
+
+
+def _rss():
+    # resident set size of the process in bytes, 0 where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+class StageProfiler:
+    '''
+    Forward pre/post hooks on the main submodules of a detectron2 model,
+    recording the wall time and the change of memory of every call while
+    active: allocated CUDA memory on GPU, resident set size of the process on
+    CPU (coarser, as it also counts the allocator caches). On GPU the times come from CUDA events, resolved with
+    a single synchronize in collect(), so profiling does not serialize the
+    model. Hooks cost a flag check while inactive.
+    '''
+    def __init__(self, model, stages=STAGES):
+        # unwrap DistributedDataParallel
+        self.model = model.module if hasattr(model, 'module') else model
+        self.cuda = next(self.model.parameters()).is_cuda
+        self.active = False
+        self._records = []
+        self._open = {}
+        self._handles = []
+        modules = dict(self.model.named_modules())
+        for path, stage in stages:
+            if path in modules:
+                module = modules[path]
+                self._handles.append(module.register_forward_pre_hook(self._pre_hook(stage)))
+                self._handles.append(module.register_forward_hook(self._post_hook(stage)))
+        self.stages = [stage for path, stage in stages if path in modules]
+
+    def _now(self):
+        if self.cuda:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def _memory(self):
+        return torch.cuda.memory_allocated() if self.cuda else _rss()
+
+    def _pre_hook(self, stage):
+        def hook(module, inputs):
+            if self.active:
+                memory = self._memory()
+                self._open.setdefault(stage, []).append((time.perf_counter(), self._now(), memory))
+        return hook
+
+    def _post_hook(self, stage):
+        def hook(module, inputs, outputs):
+            if self.active and self._open.get(stage):
+                host_start, start, memory = self._open[stage].pop()
+                end = self._now()
+                memory = self._memory() - memory
+                self._records.append((stage, host_start, start, end, memory))
+        return hook
+
+    def start(self):
+        self._records = []
+        self._open = {}
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def collect(self):
+        '''
+        Returns the calls recorded since start() as a list of
+        (stage, host start time in s, duration in s, memory change in bytes).
+        '''
+        if self.cuda and self._records:
+            torch.cuda.synchronize()
+        calls = []
+        for stage, host_start, start, end, memory in self._records:
+            seconds = start.elapsed_time(end) / 1e3 if self.cuda else end - start
+            calls.append((stage, host_start, seconds, memory))
+        self._records = []
+        return calls
+
+    def remove(self):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+
+class ProfilerHook(HookBase):
+    '''
+    Profiles the forward pass of one training iteration every `period`:
+    time and memory per stage are put in the EventStorage as
+    profile/<stage>_ms and profile/<stage>_mem_mb, and the stages of the
+    first max_trace_iters profiled iterations are written as a Chrome trace
+    (chrome://tracing or ui.perfetto.dev) at the end of the training.
+    Only the training forward pass is profiled, not the forward passes of
+    other hooks like LossEvalHook.
+    '''
+    def __init__(self, period, model, trace_file=None, max_trace_iters=50):
+        self._period = period
+        self._model = model
+        self._trace_file = trace_file
+        self._max_trace_iters = max_trace_iters
+        self._trace = []
+        self._traced_iters = 0
+
+    def before_train(self):
+        self._profiler = StageProfiler(self._model)
+        # the training forward pass is over once the top-level model returns
+        model = self._profiler.model
+        self._stop_handle = model.register_forward_hook(lambda module, inputs, outputs: self._profiler.stop())
+        self._t0 = time.perf_counter()
+
+    def before_step(self):
+        if self._period > 0 and self.trainer.iter % self._period == 0:
+            self._step_start = time.perf_counter()
+            self._profiler.start()
+
+    def after_step(self):
+        if not (self._period > 0 and self.trainer.iter % self._period == 0):
+            return
+        self._profiler.stop()
+        step_seconds = time.perf_counter() - self._step_start
+        calls = self._profiler.collect()
+
+        seconds = {stage: 0.0 for stage in self._profiler.stages}
+        memory = {stage: 0 for stage in self._profiler.stages}
+        for stage, _, duration, mem in calls:
+            seconds[stage] += duration
+            memory[stage] += mem
+        scalars = {'profile/{}_ms'.format(stage): 1e3 * s for stage, s in seconds.items()}
+        scalars.update({'profile/{}_mem_mb'.format(stage): m / 2 ** 20 for stage, m in memory.items()})
+        scalars['profile/step_ms'] = 1e3 * step_seconds
+        self.trainer.storage.put_scalars(smoothing_hint=False, **scalars)
+
+        if self._traced_iters < self._max_trace_iters:
+            self._traced_iters += 1
+            it = self.trainer.iter
+            self._trace.append(self._event('step', self._step_start, step_seconds, it, 0))
+            for stage, host_start, duration, mem in calls:
+                self._trace.append(self._event(stage, host_start, duration, it, mem))
+
+    def _event(self, name, start, seconds, it, memory):
+        # Chrome trace "complete" event, times in microseconds
+        return {
+            'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+            'ts': 1e6 * (start - self._t0), 'dur': 1e6 * seconds,
+            'args': {'iter': it, 'mem_mb': memory / 2 ** 20},
+        }
+
+    def after_train(self):
+        self._profiler.remove()
+        self._stop_handle.remove()
+        if self._trace_file and self._trace:
+            os.makedirs(os.path.dirname(self._trace_file) or '.', exist_ok=True)
+            with open(self._trace_file, 'w') as f:
+                json.dump({'traceEvents': self._trace, 'displayTimeUnit': 'ms'}, f)
+
+
+def build_profiler_hook(cfg, model):
+    '''
+    ProfilerHook every cfg.TEST.PROFILE_PERIOD iterations writing its trace
+    to OUTPUT_DIR/profile_trace.json, or None when the key is unset or 0.
+    '''
+    period = cfg.TEST.get('PROFILE_PERIOD', 0)
+    if not period:
+        return None
+    return ProfilerHook(period, model, os.path.join(cfg.OUTPUT_DIR, 'profile_trace.json'))
+
+
+def register_profiler_hook(trainer, cfg):
+    '''
+    Adds the hook of build_profiler_hook, if enabled, to a trainer built
+    without it (DefaultTrainer). It goes first as in MyTrainer.build_hooks,
+    so that its scalars are written with the iteration they belong to and
+    its step time does not include the writer and evaluation hooks.
+    '''
+    hook = build_profiler_hook(cfg, trainer.model)
+    if hook is not None:
+        hook.trainer = weakref.proxy(trainer)
+        trainer._hooks.insert(0, hook)
+    return hook
@@ -13,7 +13,8 @@ from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 from detectron2.structures import BoxMode
 
-from mots_utils import load_txt, rletools, load_images_for_folder
+from mots_utils import iter_txt, rletools, load_images_for_folder
+from image_size import SizeIndex
 
 # Only this path has to be changed
 dataset_path = Path('/home/adityassrana/MCV_UAB/m5-vr/project/week3_dev/Datasets')
@@ -55,18 +56,19 @@ def get_testing_files():
 
 def get_dataset_dicts():
     dataset_dicts = []
+    sizes = SizeIndex()  # (path, mtime) -> size index, only the headers of new images are read
     for train_folder, train_txt in get_training_files():
         # get data folder and its corresponding txt file
         # load the annotations for the folder
-        annotations = load_txt(train_txt)
+        annotations = iter_txt(train_txt)
         image_paths = sorted(os.listdir(train_folder))
-        for indx, (image_path, (file_id, objects)) in enumerate(zip(image_paths, list(annotations.items()))):
+        for indx, (image_path, (file_id, objects)) in enumerate(zip(image_paths, annotations)):
             #check the file is png or jpg
             if image_path.split('.')[1] in ['png','jpg']:
                 record = {}
 
                 filename = os.path.join(train_folder, image_path)
-                height,width = cv2.imread(filename).shape[:2]
+                height, width = sizes.get(filename)
 
                 record["file_name"] = filename
                 record["image_id"] = filename
@@ -74,20 +76,22 @@ def get_dataset_dicts():
                 record["width"] = width
 
                 objs = []
-                for obj in objects:
-                    if obj.track_id != 10000:
-                        category_id = obj.class_id    
-                        bbox = rletools.toBbox(obj.mask)
-
-                        obj_dic = {
-                            "bbox" : list(bbox),
-                            "bbox_mode" : BoxMode.XYWH_ABS,
-                            "category_id" : category_id
-                        }
-                        objs.append(obj_dic)
+                objects = [obj for obj in objects if obj.track_id != 10000]
+                # one toBbox call for all the objects of the frame
+                bboxes = rletools.toBbox([obj.mask for obj in objects]) if objects else []
+                for obj, bbox in zip(objects, bboxes):
+                    category_id = obj.class_id
+
+                    obj_dic = {
+                        "bbox" : list(bbox),
+                        "bbox_mode" : BoxMode.XYWH_ABS,
+                        "category_id" : category_id
+                    }
+                    objs.append(obj_dic)
 
                 record["annotations"] = objs
                 dataset_dicts.append(record)
+    sizes.save()
     return dataset_dicts
 
 DatasetCatalog.register("kitti_train", get_dataset_dicts)
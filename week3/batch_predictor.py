@@ -0,0 +1,72 @@
+import cv2
+import torch
+
+from detectron2.checkpoint import DetectionCheckpointer
+from detectron2.data import MetadataCatalog
+from detectron2.data import transforms as T
+from detectron2.modeling import build_model
+
+
+class BatchPredictor:
+    '''
+    Same pre-processing and outputs as detectron2's DefaultPredictor, but the
+    model is called once per list of images instead of once per image.
+    '''
+    def __init__(self, cfg, batch_size=1):
+        self.cfg = cfg.clone()
+        self.model = build_model(self.cfg)
+        self.model.eval()
+        if len(cfg.DATASETS.TEST):
+            self.metadata = MetadataCatalog.get(cfg.DATASETS.TEST[0])
+
+        checkpointer = DetectionCheckpointer(self.model)
+        checkpointer.load(cfg.MODEL.WEIGHTS)
+
+        self.aug = T.ResizeShortestEdge(
+            [cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MIN_SIZE_TEST], cfg.INPUT.MAX_SIZE_TEST
+        )
+        self.input_format = cfg.INPUT.FORMAT
+        assert self.input_format in ["RGB", "BGR"], self.input_format
+        self.batch_size = batch_size
+
+    def __call__(self, images):
+        '''
+        images: list of BGR images (H, W, C) as read by cv2.imread.
+        Returns the list of model outputs, one dict per image.
+        '''
+        with torch.no_grad():
+            inputs = []
+            for original_image in images:
+                if self.input_format == "RGB":
+                    original_image = original_image[:, :, ::-1]
+                height, width = original_image.shape[:2]
+                image = self.aug.get_transform(original_image).apply_image(original_image)
+                image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+                inputs.append({"image": image, "height": height, "width": width})
+
+            return self.model(inputs)
+
+    def predict_files(self, paths):
+        '''
+        Read and predict a list of image files, batching images with the same
+        size together. Yields (path, image, outputs) for every file that can be
+        read; the order of the files is not kept when their sizes differ.
+        '''
+        pending = {}
+        for path in paths:
+            im = cv2.imread(path)
+            if im is None:
+                continue
+
+            batch = pending.setdefault(im.shape, [])
+            batch.append((path, im))
+            if len(batch) == self.batch_size:
+                yield from self._predict_batch(pending.pop(im.shape))
+
+        for batch in pending.values():
+            yield from self._predict_batch(batch)
+
+    def _predict_batch(self, batch):
+        outputs = self([im for _, im in batch])
+        for (path, im), output in zip(batch, outputs):
+            yield path, im, output
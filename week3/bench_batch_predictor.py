@@ -0,0 +1,60 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import torch
+
+from detectron2 import model_zoo
+from detectron2.config import get_cfg
+from detectron2.engine import DefaultPredictor
+
+from batch_predictor import BatchPredictor
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='CPU throughput of DefaultPredictor vs BatchPredictor')
+
+    parser.add_argument('--config', type=str, default='COCO-Detection/faster_rcnn_R_50_FPN_3x.yaml',
+                        help='model zoo config')
+
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='batch sizes to try')
+
+    parser.add_argument('--images', type=int, default=16,
+                        help='number of synthetic KITTI sized images')
+
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads(),
+                        help='torch intra-op threads')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    torch.set_num_threads(args.threads)
+
+    cfg = get_cfg()
+    cfg.merge_from_file(model_zoo.get_config_file(args.config))
+    cfg.MODEL.DEVICE = 'cpu'
+    cfg.MODEL.WEIGHTS = ''  # random weights, only the speed is measured
+
+    rng = np.random.RandomState(0)
+    images = [rng.randint(0, 255, (375, 1242, 3), dtype=np.uint8) for _ in range(args.images)]
+
+    default_predictor = DefaultPredictor(cfg)
+    default_predictor(images[0])  # warm up
+    start = time.perf_counter()
+    for im in images:
+        default_predictor(im)
+    print('{:>16} {:>10.2f} images/s'.format('DefaultPredictor', len(images) / (time.perf_counter() - start)))
+
+    # same random weights, so that both predictors keep the same number of detections
+    predictor = BatchPredictor(cfg)
+    predictor.model.load_state_dict(default_predictor.model.state_dict())
+    for batch_size in args.batch_sizes:
+        predictor([images[0]] * batch_size)  # warm up
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            predictor(images[i:i + batch_size])
+        print('{:>16} {:>10.2f} images/s'.format('batch {}'.format(batch_size), len(images) / (time.perf_counter() - start)))
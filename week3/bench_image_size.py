@@ -0,0 +1,49 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+
+from image_size import probe_size
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Per-image latency of reading the image size from the header '
+                                                 'instead of decoding the image')
+
+    parser.add_argument('--data', type=str, default='/home/group02/mcv/datasets/KITTI-MOTS/training/image_02',
+                        help='folder with one subfolder of images per sequence')
+
+    parser.add_argument('--max_frames', type=int, default=100,
+                        help='images timed per sequence')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('{:>10} {:>8} {:>12} {:>12} {:>8}'.format('sequence', 'frames', 'decode (ms)', 'header (ms)', 'speedup'))
+    for seq_dir in sorted(glob.glob(os.path.join(args.data, '*'))):
+        files = sorted(glob.glob(os.path.join(seq_dir, '*.png')) + glob.glob(os.path.join(seq_dir, '*.jpg')))
+        files = files[:args.max_frames]
+        if not files:
+            continue
+
+        t_decode, t_header = 0, 0
+        for file in files:
+            start = time.perf_counter()
+            decoded = cv2.imread(file).shape[:2]
+            t_decode += time.perf_counter() - start
+
+            start = time.perf_counter()
+            probed = probe_size(file)
+            t_header += time.perf_counter() - start
+
+            assert probed == decoded, file
+
+        print('{:>10} {:>8} {:>12.2f} {:>12.3f} {:>7.0f}x'.format(
+            os.path.basename(seq_dir), len(files), t_decode / len(files) * 1e3, t_header / len(files) * 1e3,
+            t_decode / t_header))
@@ -0,0 +1,90 @@
+import time
+import argparse
+import sys
+
+import numpy as np
+
+from detectron2.structures import BoxMode
+
+from instance_utils import read_annotations
+
+
+def read_annotations_loop(gt, map_classes):
+    # per-instance implementation previously used by the KITTI-MOTS loaders
+    patterns = list(np.unique(gt))[1:-1]
+
+    objs = []
+    for pattern in patterns:
+        coords = np.argwhere(gt==pattern)
+
+        x0, y0 = coords.min(axis=0)
+        x1, y1 = coords.max(axis=0)
+
+        bbox = [y0, x0, y1, x1]
+
+        obj = {
+            "bbox": bbox,
+            "bbox_mode":BoxMode.XYXY_ABS,
+            "category_id": map_classes[int(np.floor(gt[coords[0][0]][coords[0][1]]/1e3))],
+            "iscrowd": 0
+        }
+
+        objs.append(obj)
+
+    return objs
+
+
+def synthetic_frame(num_instances, height=375, width=1242, seed=0):
+    # random ellipses with KITTI-MOTS ids (class_id * 1000 + instance) plus an ignore region
+    rng = np.random.RandomState(seed)
+    gt = np.zeros((height, width), dtype=np.uint16)
+    yy, xx = np.mgrid[:height, :width]
+
+    for i in range(num_instances):
+        cy, cx = rng.randint(0, height), rng.randint(0, width)
+        ry, rx = rng.randint(5, 60), rng.randint(5, 80)
+        inside = ((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2 <= 1
+        gt[inside] = rng.randint(1, 3) * 1000 + i
+
+    gt[:20, :100] = 10000
+    return gt
+
+
+def time_fn(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--instances', type=int, nargs='+', default=[1, 5, 10, 25, 50, 100, 200],
+                        help='number of instances of the synthetic frames')
+
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timing repetitions per frame')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    map_classes = {1:0, 2:1}
+
+    print('{:>10} {:>10} {:>12} {:>12} {:>8}'.format('instances', 'objects', 'loop (ms)', 'single (ms)', 'speedup'))
+    for n in args.instances:
+        gt = synthetic_frame(n, seed=n)
+
+        loop = read_annotations_loop(gt, map_classes)
+        single = read_annotations(gt, map_classes)
+        assert [list(map(int, o["bbox"])) for o in loop] == [o["bbox"] for o in single]
+        assert [o["category_id"] for o in loop] == [o["category_id"] for o in single]
+
+        t_loop = time_fn(lambda: read_annotations_loop(gt, map_classes), args.repeat)
+        t_single = time_fn(lambda: read_annotations(gt, map_classes), args.repeat)
+        print('{:>10} {:>10} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+            n, len(single), t_loop * 1e3, t_single * 1e3, t_loop / t_single))
@@ -0,0 +1,72 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import PIL.Image as Image
+
+from mots_utils import SegmentedObject, load_image, rletools
+
+
+def load_image_loop(filename, id_divisor=1000):
+    # previous load_image: one full-frame scan and one full-frame RLE encode per object
+    img = np.array(Image.open(filename))
+    obj_ids = np.unique(img)
+
+    objects = []
+    mask = np.zeros(img.shape, dtype=np.uint8, order="F")
+    for idx, obj_id in enumerate(obj_ids):
+        if obj_id == 0:  # background
+            continue
+        mask.fill(0)
+        pixels_of_elem = np.where(img == obj_id)
+        mask[pixels_of_elem] = 1
+        objects.append(SegmentedObject(
+            rletools.encode(mask),
+            obj_id // id_divisor,
+            obj_id
+        ))
+
+    return objects
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Per-frame latency of mots_utils.load_image')
+
+    parser.add_argument('--data', type=str, default='/home/group02/mcv/datasets/KITTI-MOTS/instances',
+                        help='folder with one subfolder of PNG instance maps per sequence')
+
+    parser.add_argument('--max_frames', type=int, default=100,
+                        help='frames timed per sequence')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('{:>10} {:>8} {:>10} {:>12} {:>14} {:>8}'.format(
+        'sequence', 'frames', 'objects', 'loop (ms)', 'batched (ms)', 'speedup'))
+    for seq_dir in sorted(glob.glob(os.path.join(args.data, '*'))):
+        files = sorted(glob.glob(os.path.join(seq_dir, '*.png')))[:args.max_frames]
+        if not files:
+            continue
+
+        t_loop, t_batched, num_objects = 0, 0, 0
+        for file in files:
+            start = time.perf_counter()
+            loop = load_image_loop(file)
+            t_loop += time.perf_counter() - start
+
+            start = time.perf_counter()
+            batched = load_image(file)
+            t_batched += time.perf_counter() - start
+
+            assert [(o.track_id, o.mask['counts']) for o in loop] == [(o.track_id, o.mask['counts']) for o in batched]
+            num_objects += len(batched)
+
+        print('{:>10} {:>8} {:>10} {:>12.2f} {:>14.2f} {:>7.1f}x'.format(
+            os.path.basename(seq_dir), len(files), num_objects,
+            t_loop / len(files) * 1e3, t_batched / len(files) * 1e3, t_loop / t_batched))
@@ -0,0 +1,96 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+from mots_utils import SegmentedObject, load_txt, rletools
+
+
+def load_txt_merge(path):
+    # previous load_txt: merges every mask into a per-frame combined RLE twice per object
+    objects_per_frame = {}
+    track_ids_per_frame = {}
+    combined_mask_per_frame = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            fields = line.split(" ")
+
+            frame = int(fields[0])
+            if frame not in objects_per_frame:
+                objects_per_frame[frame] = []
+            if frame not in track_ids_per_frame:
+                track_ids_per_frame[frame] = set()
+            if int(fields[1]) in track_ids_per_frame[frame]:
+                assert False, "Multiple objects with track id " + fields[1] + " in frame " + fields[0]
+            else:
+                track_ids_per_frame[frame].add(int(fields[1]))
+
+            class_id = int(fields[2])
+            if not(class_id == 1 or class_id == 2 or class_id == 10):
+                assert False, "Unknown object class " + fields[2]
+
+            mask = {'size': [int(fields[3]), int(fields[4])], 'counts': fields[5].encode(encoding='UTF-8')}
+            if frame not in combined_mask_per_frame:
+                combined_mask_per_frame[frame] = mask
+            elif rletools.area(rletools.merge([combined_mask_per_frame[frame], mask], intersect=True)) > 0.0:
+                assert False, "Objects with overlapping masks in frame " + fields[0]
+            else:
+                combined_mask_per_frame[frame] = rletools.merge([combined_mask_per_frame[frame], mask], intersect=False)
+            objects_per_frame[frame].append(SegmentedObject(
+                mask,
+                class_id,
+                int(fields[1])
+            ))
+
+    return objects_per_frame
+
+
+def boxes_per_object(annotation):
+    return {frame: [rletools.toBbox(obj.mask) for obj in objects if obj.track_id != 10000]
+            for frame, objects in annotation.items()}
+
+
+def boxes_per_frame(annotation):
+    boxes = {}
+    for frame, objects in annotation.items():
+        masks = [obj.mask for obj in objects if obj.track_id != 10000]
+        boxes[frame] = rletools.toBbox(masks) if masks else np.zeros((0, 4))
+    return boxes
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Time the loading of MOTS instances_txt files')
+
+    parser.add_argument('--data', type=str, default='/home/group02/mcv/datasets/KITTI-MOTS/instances_txt',
+                        help='folder with the instances_txt files')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    modes = {
+        'merge + per object toBbox': lambda path: boxes_per_object(load_txt_merge(path)),
+        'validated + batched toBbox': lambda path: boxes_per_frame(load_txt(path)),
+        'fast path + batched toBbox': lambda path: boxes_per_frame(load_txt(path, validate=False)),
+    }
+
+    files = sorted(glob.glob(os.path.join(args.data, '*.txt')))
+    totals = dict.fromkeys(modes, 0.0)
+    print('{:>10} {:>8}'.format('sequence', 'objects') + ''.join(' {:>28}'.format(m) for m in modes))
+    for path in files:
+        times = []
+        for mode, fn in modes.items():
+            start = time.perf_counter()
+            boxes = fn(path)
+            times.append(time.perf_counter() - start)
+            totals[mode] += times[-1]
+        num_objects = sum(len(b) for b in boxes.values())
+        print('{:>10} {:>8}'.format(os.path.basename(path), num_objects) + ''.join(' {:>27.3f}s'.format(t) for t in times))
+
+    print('{:>19}'.format('total') + ''.join(' {:>27.3f}s'.format(t) for t in totals.values()))
@@ -0,0 +1,73 @@
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from detectron2.data import DatasetMapper
+
+from instance_utils import read_annotations
+from bench_instance_utils import synthetic_frame
+
+
+def build_records(frames, image_paths, mask_format):
+    records = []
+    for gt, filename in zip(frames, image_paths):
+        records.append({
+            "file_name": filename,
+            "image_id": filename,
+            "height": gt.shape[0],
+            "width": gt.shape[1],
+            "annotations": read_annotations(gt, {1:0, 2:1}, mask_format)
+        })
+    return records
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Record memory and mapper throughput of polygon vs RLE masks')
+
+    parser.add_argument('--frames', type=int, default=50,
+                        help='number of synthetic frames')
+
+    parser.add_argument('--instances', type=int, default=25,
+                        help='instances per synthetic frame')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    frames, image_paths = [], []
+    for i in range(args.frames):
+        gt = synthetic_frame(args.instances, seed=i)
+        image_paths.append(os.path.join(tmp_dir, '{:06d}.png'.format(i)))
+        cv2.imwrite(image_paths[-1], np.random.RandomState(i).randint(0, 255, gt.shape + (3,), dtype=np.uint8))
+        frames.append(gt)
+
+    print('{:>8} {:>12} {:>14} {:>14} {:>14}'.format('format', 'build (s)', 'heap (MB)', 'pickled (MB)', 'mapper (im/s)'))
+    for mask_format in ['polygon', 'bitmask']:
+        tracemalloc.start()
+        start = time.perf_counter()
+        records = build_records(frames, image_paths, mask_format)
+        build_time = time.perf_counter() - start
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        pickled = len(pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL))
+
+        mapper = DatasetMapper(is_train=True, augmentations=[], image_format='BGR',
+                               use_instance_mask=True, instance_mask_format=mask_format)
+        start = time.perf_counter()
+        for record in records:
+            mapper(record)
+        mapper_speed = len(records) / (time.perf_counter() - start)
+
+        print('{:>8} {:>12.2f} {:>14.2f} {:>14.2f} {:>14.1f}'.format(
+            mask_format, build_time, heap / 2**20, pickled / 2**20, mapper_speed))
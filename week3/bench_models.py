@@ -0,0 +1,170 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from detectron2 import model_zoo
+from detectron2.config import get_cfg
+
+from batch_predictor import BatchPredictor
+
+# model zoo configs compared in the project
+CONFIGS = [
+    'COCO-Detection/faster_rcnn_R_50_FPN_3x.yaml',
+    'COCO-Detection/faster_rcnn_X_101_32x8d_FPN_3x.yaml',
+    'COCO-Detection/retinanet_R_101_FPN_3x.yaml',
+    'COCO-InstanceSegmentation/mask_rcnn_R_50_FPN_3x.yaml',
+    'COCO-InstanceSegmentation/mask_rcnn_X_101_32x8d_FPN_3x.yaml',
+    'Cityscapes/mask_rcnn_R_50_FPN.yaml',
+]
+
+
+def percentile_ms(times, q):
+    return 1e3 * float(np.percentile(times, q))
+
+
+def bench_config(config, batch_sizes, threads_list, iters, warmup, height=375, width=1242):
+    '''
+    Runs in its own process, so that the peak RSS is the one of this model only.
+    '''
+    torch.manual_seed(0)  # same random weights, and so the same detections, on every run
+    cfg = get_cfg()
+    cfg.merge_from_file(model_zoo.get_config_file(config))
+    cfg.MODEL.DEVICE = 'cpu'
+    cfg.MODEL.WEIGHTS = ''  # random weights, only the speed is measured
+
+    rng = np.random.RandomState(0)
+    images = [rng.randint(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(max(batch_sizes))]
+
+    start = time.perf_counter()
+    predictor = BatchPredictor(cfg)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictor(images[:1])
+    first_call_seconds = time.perf_counter() - start
+
+    runs = []
+    for threads in threads_list:
+        torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            batch = images[:batch_size]
+            for _ in range(warmup):
+                predictor(batch)
+            times = []
+            for _ in range(iters):
+                start = time.perf_counter()
+                predictor(batch)
+                times.append(time.perf_counter() - start)
+            # latency of one image: the batch latency divided by its size
+            per_image = np.array(times) / batch_size
+            runs.append({
+                'threads': threads,
+                'batch_size': batch_size,
+                'p50_ms': round(percentile_ms(per_image, 50), 2),
+                'p95_ms': round(percentile_ms(per_image, 95), 2),
+                'p99_ms': round(percentile_ms(per_image, 99), 2),
+                'images_per_s': round(batch_size * len(times) / sum(times), 3),
+            })
+
+    return {
+        'build_seconds': round(build_seconds, 3),
+        'first_call_seconds': round(first_call_seconds, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # KB on Linux
+        'runs': runs,
+    }
+
+
+def _bench_worker(results, *args):
+    try:
+        results.put(bench_config(*args))
+    except Exception as e:
+        results.put({'error': repr(e)})
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='CPU latency, throughput and memory of the model zoo configs')
+
+    parser.add_argument('--configs', type=str, nargs='+', default=CONFIGS,
+                        help='model zoo configs')
+
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4],
+                        help='batch sizes to try')
+
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count()],
+                        help='torch intra-op thread counts to try')
+
+    parser.add_argument('--iters', type=int, default=20,
+                        help='timed calls per batch size and thread count')
+
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='untimed calls before timing each setting')
+
+    parser.add_argument('--output', type=str, default='bench_models.json',
+                        help='JSON report')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'torch': torch.__version__,
+            'python': platform.python_version(),
+            'cpu': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'iters': args.iters,
+            'warmup': args.warmup,
+            'input': [375, 1242],
+        },
+        'configs': {},
+    }
+
+    ctx = mp.get_context('spawn')
+    for config in args.configs:
+        results = ctx.Queue()
+        p = ctx.Process(target=_bench_worker,
+                        args=(results, config, args.batch_sizes, args.threads, args.iters, args.warmup))
+        p.start()
+        result = None
+        while result is None:
+            try:
+                result = results.get(timeout=10)
+            except queue.Empty:
+                if not p.is_alive():  # killed, e.g. out of memory
+                    result = {'error': 'process exited with code {}'.format(p.exitcode)}
+        p.join()
+        report['configs'][config] = result
+
+        if 'error' in result:
+            print('{}: {}'.format(config, result['error']))
+            continue
+        print('{} (first call {:.2f}s, peak RSS {:.0f} MB)'.format(
+            config, result['first_call_seconds'], result['peak_rss_mb']))
+        for run in result['runs']:
+            print('  threads {:>3} batch {:>2}: p50 {:>8.1f} ms  p95 {:>8.1f} ms  p99 {:>8.1f} ms  {:>7.2f} images/s'.format(
+                run['threads'], run['batch_size'], run['p50_ms'], run['p95_ms'], run['p99_ms'], run['images_per_s']))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('[INFO] Report written to ' + args.output)
@@ -0,0 +1,63 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import torch
+
+from detectron2.data import MetadataCatalog
+from detectron2.structures import Boxes, Instances
+
+from bench_instance_utils import synthetic_frame
+from fast_renderer import _draw_fast
+from inference_pipeline import _draw_visualizer
+from instance_utils import extract_instances
+
+
+def synthetic_predictions(num_instances, seed=0):
+    # KITTI sized image and one prediction per ellipse of a synthetic instance map
+    gt = synthetic_frame(num_instances, seed=seed)
+    ids, boxes, _ = extract_instances(gt)
+    rng = np.random.RandomState(seed)
+    im = rng.randint(0, 255, gt.shape + (3,), dtype=np.uint8)
+
+    instances = Instances(gt.shape)
+    instances.pred_boxes = Boxes(torch.as_tensor(boxes, dtype=torch.float32))
+    instances.scores = torch.as_tensor(rng.uniform(0.5, 1, len(ids)), dtype=torch.float32)
+    instances.pred_classes = torch.as_tensor(ids // 1000 - 1)
+    instances.pred_masks = torch.as_tensor(gt[None] == ids[:, None, None])
+    return im, instances
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Frames/s of the Visualizer and the fast renderer')
+
+    parser.add_argument('--instances', type=int, nargs='+', default=[5, 20, 50],
+                        help='number of predictions per frame')
+
+    parser.add_argument('--frames', type=int, default=20,
+                        help='frames drawn per setting')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    MetadataCatalog.get('bench_renderer').thing_classes = ['Car', 'Pedestrian']
+
+    renderers = {
+        'visualizer': _draw_visualizer,
+        'fast': _draw_fast,
+    }
+
+    print('{:>10}'.format('instances') + ''.join(' {:>16}'.format(r) for r in renderers))
+    for num_instances in args.instances:
+        im, instances = synthetic_predictions(num_instances)
+        speeds = []
+        for render in renderers.values():
+            render(im, instances, 'bench_renderer')  # warm up
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                render(im, instances, 'bench_renderer')
+            speeds.append(args.frames / (time.perf_counter() - start))
+        print('{:>10}'.format(len(instances)) + ''.join(' {:>7.1f} frames/s'.format(s) for s in speeds))
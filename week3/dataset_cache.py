@@ -0,0 +1,221 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from collections.abc import Sequence
+
+import numpy as np
+
+from detectron2.structures import BoxMode
+
+import kitti_mots
+
+# bump whenever the records produced by kitti_mots.load_frame change
+LOADER_VERSION = 2
+
+CACHE_DIR = '/home/group02/week3/cache'
+
+DEFAULT_SPLITS = [
+    '/home/group02/week3/data/split/*.txt',
+    '/home/group02/week3/data/cros_val/*.txt',
+    '/home/group02/week4/data/split/*.txt',
+]
+
+
+def cache_key(split_file, map_classes, mask_format=None, skip=()):
+    '''
+    Returns the name of the cache entry of a split and the frames it contains.
+    The name is made of a hash of the loader parameters (version, dataset roots,
+    map_classes, ...) and a hash of the split file and the path, mtime and size
+    of every ground truth file, so any change to them invalidates the entry.
+    '''
+    params = {
+        'version': LOADER_VERSION,
+        'split_file': os.path.abspath(split_file),
+        'dataset_path': kitti_mots.dataset_path,
+        'gt_path': kitti_mots.gt_path,
+        'map_classes': sorted(map_classes.items()),
+        'mask_format': mask_format,
+        'skip': sorted(skip),
+    }
+    params_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    content = hashlib.sha1()
+    with open(split_file, 'rb') as f:
+        content.update(f.read())
+
+    frames = []
+    for dataset, seq in kitti_mots.read_split(split_file, skip):
+        for filename, gt_filename in kitti_mots.list_frames(dataset, seq):
+            st = os.stat(gt_filename)
+            content.update('{}\0{}\0{}\0{}\n'.format(filename, gt_filename, st.st_mtime_ns, st.st_size).encode())
+            frames.append((filename, gt_filename))
+
+    stem = os.path.splitext(os.path.basename(split_file))[0]
+    return '{}_{}_{}'.format(stem, params_hash[:8], content.hexdigest()[:16]), frames
+
+
+def _offsets(lengths):
+    return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+
+def write_cache(path, records):
+    '''
+    Serialize detectron2 records into one .npy file per column so that they can
+    be memory mapped back. Annotations of all images are concatenated and
+    indexed by offsets.
+    '''
+    names = [r["file_name"].encode() for r in records]
+    anns = [a for r in records for a in r["annotations"]]
+    # segmentation is either a list of polygons or a COCO RLE dict
+    segs = [a.get("segmentation", []) for a in anns]
+    polys = [p for seg in segs if isinstance(seg, list) for p in seg]
+    rles = [seg["counts"] if isinstance(seg, dict) else b'' for seg in segs]
+
+    arrays = {
+        'names': np.frombuffer(b''.join(names), dtype=np.uint8),
+        'name_offsets': _offsets([len(n) for n in names]),
+        'heights': np.array([r["height"] for r in records], dtype=np.int32),
+        'widths': np.array([r["width"] for r in records], dtype=np.int32),
+        'ann_offsets': _offsets([len(r["annotations"]) for r in records]),
+        'boxes': np.array([a["bbox"] for a in anns], dtype=np.int32).reshape(-1, 4),
+        'bbox_modes': np.array([int(a["bbox_mode"]) for a in anns], dtype=np.int8),
+        'categories': np.array([a["category_id"] for a in anns], dtype=np.int32),
+        'iscrowd': np.array([a["iscrowd"] for a in anns], dtype=np.int8),
+        'seg_offsets': _offsets([len(seg) if isinstance(seg, list) else 0 for seg in segs]),
+        'poly_offsets': _offsets([len(p) for p in polys]),
+        'coords': np.array([c for p in polys for c in p], dtype=np.float32),
+        'rle_offsets': _offsets([len(c) for c in rles]),
+        'rle_counts': np.frombuffer(b''.join(rles), dtype=np.uint8),
+    }
+
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    os.makedirs(tmp_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), array)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+
+
+class CachedDatasetDicts(Sequence):
+    '''
+    Read-only list of detectron2 records backed by the memory mapped columns
+    of a cache entry. Records are only built when they are accessed.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._arrays = {}
+        for file in glob.glob(os.path.join(path, '*.npy')):
+            name = os.path.splitext(os.path.basename(file))[0]
+            self._arrays[name] = np.load(file, mmap_mode='r')
+
+    def __len__(self):
+        return len(self._arrays['heights'])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('record index out of range')
+
+        a = self._arrays
+        name_start, name_end = a['name_offsets'][idx:idx + 2]
+        filename = bytes(a['names'][name_start:name_end]).decode()
+
+        annotations = []
+        for j in range(*a['ann_offsets'][idx:idx + 2]):
+            obj = {
+                "bbox": a['boxes'][j].tolist(),
+                "bbox_mode": BoxMode(int(a['bbox_modes'][j])),
+                "category_id": int(a['categories'][j]),
+                "iscrowd": int(a['iscrowd'][j])
+            }
+            seg_start, seg_end = a['seg_offsets'][j:j + 2]
+            if seg_end > seg_start:
+                obj["segmentation"] = [
+                    a['coords'][a['poly_offsets'][p]:a['poly_offsets'][p + 1]].tolist()
+                    for p in range(seg_start, seg_end)
+                ]
+            rle_start, rle_end = a['rle_offsets'][j:j + 2]
+            if rle_end > rle_start:
+                obj["segmentation"] = {
+                    'size': [int(a['heights'][idx]), int(a['widths'][idx])],
+                    'counts': bytes(a['rle_counts'][rle_start:rle_end])
+                }
+            annotations.append(obj)
+
+        return {
+            "file_name": filename,
+            "image_id": filename,
+            "height": int(a['heights'][idx]),
+            "width": int(a['widths'][idx]),
+            "annotations": annotations
+        }
+
+
+def load_cached(split_file, map_classes, mask_format=None, skip=(), cache_dir=CACHE_DIR, num_workers=0):
+    '''
+    Cached version of kitti_mots.load_dataset. The records are parsed from the
+    ground truth PNGs (with num_workers processes) only the first time or when
+    any of them changed, and memory mapped from cache_dir afterwards.
+    '''
+    key, frames = cache_key(split_file, map_classes, mask_format, skip)
+    path = os.path.join(cache_dir, key)
+
+    if not os.path.isdir(path):
+        print('[INFO] Building dataset cache: ', path)
+        records = kitti_mots.load_frames(frames, map_classes, mask_format, num_workers)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # remove the entries of the same split and parameters whose ground truth
+        # fingerprint is outdated; in-flight writes of other processes (.tmp<pid>)
+        # and entries of other splits or parameters are left alone
+        prefix = key.rsplit('_', 1)[0] + '_'
+        for name in os.listdir(cache_dir):
+            if name != key and name.startswith(prefix) and re.fullmatch('[0-9a-f]{16}', name[len(prefix):]):
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        write_cache(path, records)
+
+    return CachedDatasetDicts(path)
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Pre-warm the KITTI-MOTS / MOTSChallenge dataset cache')
+
+    parser.add_argument('--splits', type=str, nargs='+', default=DEFAULT_SPLITS,
+                        help='split files (or glob patterns) to cache')
+
+    parser.add_argument('--map_classes', type=str, nargs='+', default=['1:0', '2:1'],
+                        help='KITTI-MOTS class id to category id, as class:category')
+
+    parser.add_argument('--mask_format', type=str, default=None,
+                        choices=['polygon', 'bitmask'],
+                        help='also store the instance masks as contour polygons or COCO RLE')
+
+    parser.add_argument('--skip', type=str, nargs='*', default=[],
+                        help='datasets to leave out, e.g. MOTSChallenge')
+
+    parser.add_argument('--cache_dir', type=str, default=CACHE_DIR,
+                        help='where to store the cache')
+
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes used to parse the ground truth')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    map_classes = {int(k): int(v) for k, v in (m.split(':') for m in args.map_classes)}
+
+    split_files = sorted(f for pattern in args.splits for f in glob.glob(pattern))
+    for split_file in split_files:
+        dataset_dicts = load_cached(split_file, map_classes, args.mask_format, args.skip, args.cache_dir, args.workers)
+        print(split_file, len(dataset_dicts), 'images')
@@ -0,0 +1,98 @@
+import colorsys
+from functools import partial
+
+import cv2
+import numpy as np
+
+from detectron2.data import MetadataCatalog
+
+
+def class_palette(num_classes, seed=0):
+    '''
+    One BGR color per class, with evenly spread hues so that neighbouring
+    class ids get distinguishable colors.
+    '''
+    hues = (seed + np.arange(num_classes) * 0.618033988749895) % 1.0
+    rgb = np.array([colorsys.hsv_to_rgb(h, 0.75, 1.0) for h in hues]) * 255
+    return np.ascontiguousarray(rgb[:, ::-1]).astype(np.uint8)
+
+
+def _mask_windows(instances, width, height, margin=2):
+    if not instances.has('pred_boxes'):
+        return np.tile([0, 0, width, height], (len(instances), 1))
+    boxes = instances.pred_boxes.tensor.numpy()
+    windows = np.empty(boxes.shape, dtype=int)
+    windows[:, :2] = np.floor(boxes[:, :2]) - margin
+    windows[:, 2:] = np.ceil(boxes[:, 2:]) + margin + 1
+    return np.clip(windows, 0, [width, height, width, height])
+
+
+def draw_instances(im, instances, class_names, palette=None, scale=1.2, alpha=0.5):
+    '''
+    NumPy / OpenCV version of Visualizer.draw_instance_predictions: masks
+    blended with one color per class, boxes and "<class> <score>%" labels.
+    The output has the size of the Visualizer output (image size * scale).
+
+    im: BGR image (H, W, 3)
+    instances: detectron2 Instances on the cpu, with pred_boxes, scores,
+        pred_classes and optionally pred_masks
+    '''
+    if palette is None:
+        palette = class_palette(len(class_names))
+
+    classes = instances.pred_classes.numpy() if instances.has('pred_classes') else np.zeros(len(instances), int)
+    colors = palette[classes % len(palette)]
+    out = im
+
+    if instances.has('pred_masks') and len(instances):
+        masks = np.asarray(instances.pred_masks)
+        # 1 + index of the instance drawn on each pixel, later instances on top as with the Visualizer.
+        # Masks are pasted inside their boxes, so only the box (plus a margin) of each mask is read.
+        label = np.zeros(masks.shape[1:], dtype=np.int32)
+        height, width = label.shape
+        for i, (x0, y0, x1, y1) in enumerate(_mask_windows(instances, width, height)):
+            np.copyto(label[y0:y1, x0:x1], i + 1, where=masks[i, y0:y1, x0:x1])
+        foreground = label > 0
+        out = im.copy()
+        out[foreground] = (im[foreground] * (1 - alpha) + colors[label[foreground] - 1] * alpha).astype(np.uint8)
+
+    if scale != 1:
+        out = cv2.resize(out, (round(im.shape[1] * scale), round(im.shape[0] * scale)),
+                         interpolation=cv2.INTER_LINEAR)
+    elif out is im:
+        out = im.copy()
+
+    if not instances.has('pred_boxes'):
+        return out
+
+    boxes = np.round(instances.pred_boxes.tensor.numpy() * scale).astype(int)
+    scores = instances.scores.numpy() if instances.has('scores') else None
+    font_scale = 0.4 * scale
+    thickness = max(1, round(scale))
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        color = tuple(int(c) for c in colors[i])
+        cv2.rectangle(out, (x0, y0), (x1, y1), color, thickness)
+
+        label = class_names[classes[i]] if classes[i] < len(class_names) else str(classes[i])
+        if scores is not None:
+            label = '{} {:.0f}%'.format(label, scores[i] * 100)
+        (w, h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        y = max(y0, h + baseline)
+        cv2.rectangle(out, (x0, y - h - baseline), (x0 + w, y), color, cv2.FILLED)
+        cv2.putText(out, label, (x0, y - baseline), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 1,
+                    cv2.LINE_AA)
+
+    return out
+
+
+def _draw_fast(im, instances, metadata_name, scale=1.2, alpha=0.5):
+    class_names = MetadataCatalog.get(metadata_name).get('thing_classes', [])
+    return draw_instances(im, instances, class_names, class_palette(max(len(class_names), 1)), scale, alpha)
+
+
+def fast_renderer(metadata_name, scale=1.2, alpha=0.5):
+    '''
+    Renderer for InferencePipeline drawing with draw_instances. It can be
+    pickled to run in worker processes.
+    '''
+    return partial(_draw_fast, metadata_name=metadata_name, scale=scale, alpha=alpha)
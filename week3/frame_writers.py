@@ -0,0 +1,137 @@
+import os
+import threading
+
+import cv2
+
+# codec -> container of the video file
+VIDEO_CODECS = {
+    'mp4v': '.mp4',
+    'avc1': '.mp4',
+    'MJPG': '.avi',
+}
+
+
+class ImageWriter:
+    '''
+    One image file per frame, as the inference scripts always did. Each
+    frame is recorded in the manifest (InferenceManifest) once written.
+    '''
+    def __init__(self, manifest=None):
+        self.manifest = manifest
+
+    def __call__(self, output_path, image):
+        cv2.imwrite(output_path, image)
+        if self.manifest is not None:
+            self.manifest.mark_done(output_path)
+
+    def close(self):
+        pass
+
+
+class NullWriter:
+    '''
+    Writes nothing, for runs only dumping the predictions.
+    '''
+    def __call__(self, output_path, image):
+        pass
+
+    def close(self):
+        pass
+
+
+class SequenceVideoWriter:
+    '''
+    Streams the rendered frames of a sequence into a single video file.
+
+    Frames are identified by the output path they would have been written to
+    as images, and encoded in the order of frame_paths whatever the order
+    they arrive in (the inference pipeline renders them concurrently). Frames
+    that never arrive, e.g. unreadable images, are skipped once max_pending
+    later frames are waiting. Every stills-th frame is also written as an
+    image at its output path, 0 to write no stills. The frames are recorded
+    in the manifest (InferenceManifest) when the video is closed. Thread-safe.
+
+    video_path: file name without extension, the codec decides the container
+    quality: 0-100, only supported by MJPG
+    '''
+    def __init__(self, video_path, frame_paths, fps=10, codec='mp4v', quality=None, stills=0, max_pending=32,
+                 manifest=None):
+        self.video_path = video_path + VIDEO_CODECS.get(codec, '.avi')
+        self.codec = codec
+        self.fps = fps
+        self.quality = quality
+        self.stills = stills
+        self.max_pending = max_pending
+        self.manifest = manifest
+        self.encoded = []
+        self.frame_index = {path: i for i, path in enumerate(frame_paths)}
+        self.next_index = 0
+        self.pending = {}
+        self.frames = 0
+        self._writer = None
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _open(self, image):
+        self._size = (image.shape[1], image.shape[0])
+        # OpenCV's own MJPEG encoder is the one honouring the quality setting
+        backend = cv2.CAP_OPENCV_MJPEG if self.codec == 'MJPG' else cv2.CAP_ANY
+        self._writer = cv2.VideoWriter(self.video_path, backend, cv2.VideoWriter_fourcc(*self.codec), self.fps,
+                                       self._size)
+        if not self._writer.isOpened():
+            raise RuntimeError('Could not open {} with codec {}'.format(self.video_path, self.codec))
+        if self.quality is not None and not self._writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality):
+            print('[WARNING] Codec {} does not support setting the quality'.format(self.codec))
+
+    def _encode(self, index, output_path, image):
+        if self._writer is None:
+            self._open(image)
+        if (image.shape[1], image.shape[0]) != self._size:
+            image = cv2.resize(image, self._size)
+        self._writer.write(image)
+        self.frames += 1
+        self.encoded.append(output_path)
+        if self.stills and index % self.stills == 0:
+            cv2.imwrite(output_path, image)
+
+    def _flush(self, force=False):
+        while self.pending:
+            if self.next_index not in self.pending:
+                if not force and len(self.pending) <= self.max_pending:
+                    return
+                self.next_index = min(self.pending)
+            output_path, image = self.pending.pop(self.next_index)
+            self._encode(self.next_index, output_path, image)
+            self.next_index += 1
+
+    def __call__(self, output_path, image):
+        with self._lock:
+            index = self.frame_index[output_path]
+            if index < self.next_index:
+                return  # arrived after being skipped
+            self.pending[index] = (output_path, image)
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush(force=True)
+            if self._writer is not None:
+                self._writer.release()
+                print('[INFO] Wrote {} frames to {}'.format(self.frames, self.video_path))
+            if self.manifest is not None:
+                for output_path in self.encoded:
+                    self.manifest.mark_done(output_path, self.video_path)
+
+
+def make_writer(output_mode, output_dir, name, frame_paths, codec='mp4v', quality=None, stills=0, manifest=None):
+    '''
+    Writer for the --output_mode of the inference scripts: 'images' writes
+    every frame at its output path, 'video' writes output_dir/name.<ext>,
+    'none' writes nothing.
+    '''
+    if output_mode == 'none':
+        return NullWriter()
+    if output_mode == 'images':
+        return ImageWriter(manifest)
+    return SequenceVideoWriter(os.path.join(output_dir, name), frame_paths, codec=codec, quality=quality,
+                               stills=stills, manifest=manifest)
@@ -0,0 +1,132 @@
+import json
+import os
+import struct
+
+import cv2
+
+INDEX_PATH = '/home/group02/week3/cache/image_sizes.json'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start of frame markers (baseline, progressive, lossless, ...), not DHT (C4), JPG (C8) nor DAC (CC)
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _png_size(f):
+    # the IHDR chunk always comes first: length, 'IHDR', width, height
+    header = f.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', header[16:24])
+    return height, width
+
+
+def _jpeg_size(f):
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':  # garbage between segments
+            byte = f.read(1)
+        while byte == b'\xff':  # fill bytes
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without length
+            continue
+        if marker == 0xD9 or marker == 0xDA:  # end of image or start of scan before any frame header
+            return None
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        length = struct.unpack('>H', length)[0]
+        if marker in JPEG_SOF:
+            segment = f.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack('>HH', segment[1:5])
+            return (height, width) if height and width else None
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def probe_size(filename):
+    '''
+    (height, width) of a PNG or JPEG image read from its header only,
+    None if the file is not one of them or its header can not be parsed.
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            start = f.read(8)
+            f.seek(0)
+            if start == PNG_SIGNATURE:
+                return _png_size(f)
+            if start[:2] == b'\xff\xd8':
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def image_size(filename):
+    '''
+    (height, width) of an image, decoding it completely only if its header
+    can not be read by probe_size.
+    '''
+    size = probe_size(filename)
+    if size is None:
+        im = cv2.imread(filename)
+        if im is None:
+            raise IOError('Can not read image ' + filename)
+        size = im.shape[:2]
+    return size
+
+
+class SizeIndex:
+    '''
+    Persistent (path, mtime) -> (height, width) index, so that registering a
+    dataset again only stats the images. Saved as JSON when closed, merged
+    with the entries other processes saved meanwhile:
+
+    with SizeIndex() as sizes:
+        height, width = sizes.get(filename)
+    '''
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._sizes = self._load()
+        self._new = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):  # missing, or truncated by a crash
+            return {}
+
+    def get(self, filename):
+        filename = os.path.abspath(filename)
+        mtime = os.stat(filename).st_mtime_ns
+        entry = self._new.get(filename) or self._sizes.get(filename)
+        if entry is not None and entry[0] == mtime:
+            return entry[1], entry[2]
+        height, width = image_size(filename)
+        self._new[filename] = [mtime, height, width]
+        return height, width
+
+    def save(self):
+        if not self._new:
+            return
+        sizes = self._load()
+        sizes.update(self._new)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp{}'.format(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(sizes, f)
+        os.replace(tmp_path, self.path)
+        self._sizes = sizes
+        self._new = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
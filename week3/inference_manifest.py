@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_NAME = 'inference_manifest.jsonl'
+
+
+def config_hash(cfg, **options):
+    '''
+    Hash of everything deciding the outputs of an inference run: the
+    detectron2 config, the weights file when it is a local file (it changes
+    when a model is retrained) and script options such as thresholds.
+    '''
+    h = hashlib.sha1(cfg.dump().encode())
+    if os.path.isfile(cfg.MODEL.WEIGHTS):
+        st = os.stat(cfg.MODEL.WEIGHTS)
+        h.update('{} {}'.format(st.st_size, st.st_mtime_ns).encode())
+    h.update(json.dumps(options, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class InferenceManifest:
+    '''
+    Append-only record of the input files an inference run has processed,
+    one JSON line per input: {"input", "size", "mtime_ns", "config", "output"}.
+
+    With resume=True the records of a previous run are kept, and pending()
+    drops the inputs already processed with the same config hash whose input
+    file did not change and whose output still exists, so an interrupted run
+    continues where it stopped. Otherwise the manifest starts empty.
+    Lines are flushed as they are written, a line cut by a crash is ignored.
+    '''
+    def __init__(self, path, config_hash, resume=False):
+        self.path = path
+        self.config_hash = config_hash
+        self.done = {}
+        self.inputs = {}  # output path -> input path, of the jobs given to pending()
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record['config'] == self.config_hash:
+                        self.done[record['input']] = record
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a' if resume else 'w')
+
+    def is_done(self, input_path):
+        record = self.done.get(input_path)
+        if record is None or not os.path.exists(input_path):
+            return False
+        return [record['size'], record['mtime_ns']] == _file_key(input_path) and os.path.exists(record['output'])
+
+    def pending(self, jobs, whole=False):
+        '''
+        jobs: list of (input_path, output_path)
+        whole: the jobs are only done together (e.g. the frames of a video),
+            all of them are returned unless all of them were done.
+        '''
+        jobs = list(jobs)
+        for input_path, output_path in jobs:
+            self.inputs[output_path] = input_path
+
+        todo = [job for job in jobs if not self.is_done(job[0])]
+        if whole and todo:
+            todo = jobs
+        if len(todo) < len(jobs):
+            print('[INFO] Skipping {} of {} files already processed'.format(len(jobs) - len(todo), len(jobs)))
+        return todo
+
+    def mark_done(self, output_path, written_path=None):
+        '''
+        Record the input of output_path (given to pending() before) as done.
+        written_path: file actually written if not output_path, e.g. a video
+        '''
+        input_path = self.inputs[output_path]
+        size, mtime_ns = _file_key(input_path)
+        record = {'input': input_path, 'size': size, 'mtime_ns': mtime_ns, 'config': self.config_hash,
+                  'output': written_path or output_path}
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            self.done[input_path] = record
+
+    def close(self):
+        self._file.close()
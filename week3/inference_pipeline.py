@@ -0,0 +1,234 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+
+from detectron2.data import MetadataCatalog
+from detectron2.utils.visualizer import Visualizer
+
+from fast_renderer import fast_renderer
+
+_DONE = object()  # end of stream marker, put once per stage when all its workers finished
+STAGES = ['decode', 'infer', 'render', 'write']
+
+
+def _draw_visualizer(im, instances, metadata_name, scale=1.2):
+    v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(metadata_name), scale=scale)
+    out = v.draw_instance_predictions(instances)
+    return out.get_image()[:, :, ::-1]
+
+
+def visualizer_renderer(metadata_name, scale=1.2):
+    '''
+    Renderer drawing the predictions with detectron2's Visualizer, as the
+    inference scripts did. It can be pickled to run in worker processes.
+    '''
+    return partial(_draw_visualizer, metadata_name=metadata_name, scale=scale)
+
+
+# renderer factories selectable with --renderer, called with the metadata name
+RENDERERS = {
+    'visualizer': visualizer_renderer,
+    'fast': fast_renderer,
+}
+
+
+class StageCounter:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, busy, waiting=0.0):
+        with self._lock:
+            self.items += items
+            self.busy += busy
+            self.waiting += waiting
+
+    def __str__(self):
+        ms_per_item = 1e3 * self.busy / self.items if self.items else 0
+        return '{:>8}: {:>6} items, {:>8.1f} ms/item, {:>7.1f}s busy, {:>7.1f}s blocked on output'.format(
+            self.name, self.items, ms_per_item, self.busy, self.waiting)
+
+
+class InferencePipeline:
+    '''
+    Runs decode -> infer -> render -> write as separate stages connected by
+    bounded queues, so that disk I/O and rendering overlap with the model.
+    Decoding and writing use threads, rendering uses threads or, with
+    render_processes > 0, a pool of processes. A full queue blocks the stage
+    feeding it, which keeps memory bounded when the model is the bottleneck.
+
+    predictor: BatchPredictor (or any callable on a list of BGR images)
+    render: callable (image, instances) -> rendered BGR image, None to only dump
+    write: callable (output_path, image), cv2.imwrite by default
+    dump: callable (input_path, output_path, instances) storing the raw
+        predictions (PredictionWriter), called by the render workers
+    '''
+    def __init__(self, predictor, render, write=cv2.imwrite, batch_size=1, queue_size=8,
+                 decode_workers=2, render_workers=2, render_processes=0, write_workers=2, dump=None):
+        self.predictor = predictor
+        self.render = render
+        self.write = write
+        self.dump = dump
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.decode_workers = decode_workers
+        self.render_workers = render_workers
+        self.render_processes = render_processes
+        self.write_workers = write_workers
+        self.counters = {name: StageCounter(name) for name in STAGES}
+        self._errors = []
+
+    def _put(self, stage, out_queue, item):
+        start = time.perf_counter()
+        out_queue.put(item)
+        self.counters[stage].add(0, 0.0, time.perf_counter() - start)
+
+    def _drain(self, in_queue):
+        # after an error keep consuming, so that the stages upstream do not block
+        while in_queue.get() is not _DONE:
+            pass
+        in_queue.put(_DONE)
+
+    def _worker(self, stage, fn, in_queue, out_queue):
+        try:
+            while True:
+                item = in_queue.get()
+                if item is _DONE:
+                    in_queue.put(_DONE)  # let the other workers of this stage stop too
+                    return
+                start = time.perf_counter()
+                result = fn(item)
+                self.counters[stage].add(1, time.perf_counter() - start)
+                if out_queue is not None and result is not None:
+                    self._put(stage, out_queue, result)
+        except Exception as e:
+            self._errors.append(e)
+            self._drain(in_queue)
+
+    def _start_stage(self, stage, fn, num_workers, in_queue, out_queue=None):
+        workers = [threading.Thread(target=self._worker, args=(stage, fn, in_queue, out_queue), daemon=True)
+                   for _ in range(num_workers)]
+        for t in workers:
+            t.start()
+
+        def close():
+            for t in workers:
+                t.join()
+            if out_queue is not None:
+                out_queue.put(_DONE)
+
+        closer = threading.Thread(target=close, daemon=True)
+        closer.start()
+        return closer
+
+    def _decode(self, job):
+        input_path, output_path = job
+        im = cv2.imread(input_path)
+        if im is None:
+            return None
+        return input_path, output_path, im
+
+    def _render(self, item, executor=None):
+        input_path, output_path, im, instances = item
+        if self.dump is not None:
+            self.dump(input_path, output_path, instances)
+        if self.render is None:
+            return None
+        if executor is not None:
+            return output_path, executor.submit(self.render, im, instances).result()
+        return output_path, self.render(im, instances)
+
+    def _write(self, item):
+        output_path, image = item
+        self.write(output_path, image)
+
+    def _feed(self, jobs, jobs_queue):
+        try:
+            for job in jobs:
+                jobs_queue.put(job)
+        except Exception as e:
+            self._errors.append(e)
+        jobs_queue.put(_DONE)
+
+    def _infer(self, decoded, inferred):
+        # batches consecutive decoded images of the same size
+        pending = None
+        finished = False
+        while not finished:
+            item = pending if pending is not None else decoded.get()
+            pending = None
+            if item is _DONE:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = decoded.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                if item[2].shape != batch[0][2].shape:
+                    pending = item
+                    break
+                batch.append(item)
+
+            start = time.perf_counter()
+            outputs = self.predictor([im for _, _, im in batch])
+            self.counters['infer'].add(len(batch), time.perf_counter() - start)
+
+            for (input_path, output_path, im), output in zip(batch, outputs):
+                self._put('infer', inferred, (input_path, output_path, im, output["instances"].to("cpu")))
+
+    def run(self, jobs):
+        '''
+        jobs: iterable of (input_path, output_path). Unreadable images are skipped.
+        Can be called again on the same pipeline, the counters then only
+        count the images of this call.
+        '''
+        self.counters = {name: StageCounter(name) for name in STAGES}
+        self._errors = []
+        start = time.perf_counter()
+        jobs_queue = queue.Queue(self.queue_size)
+        decoded = queue.Queue(self.queue_size)
+        inferred = queue.Queue(self.queue_size)
+        rendered = queue.Queue(self.queue_size)
+
+        executor = ProcessPoolExecutor(self.render_processes) if self.render_processes > 0 else None
+        render = partial(self._render, executor=executor)
+
+        threading.Thread(target=self._feed, args=(jobs, jobs_queue), daemon=True).start()
+        closers = [
+            self._start_stage('decode', self._decode, self.decode_workers, jobs_queue, decoded),
+            self._start_stage('render', render, self.render_workers, inferred, rendered),
+            self._start_stage('write', self._write, self.write_workers, rendered),
+        ]
+
+        try:
+            self._infer(decoded, inferred)
+        except Exception as e:
+            self._errors.append(e)
+            self._drain(decoded)
+        inferred.put(_DONE)
+
+        for closer in closers:
+            closer.join()
+        if executor is not None:
+            executor.shutdown()
+
+        if self._errors:
+            raise self._errors[0]
+
+        elapsed = time.perf_counter() - start
+        written = self.counters['write'].items
+        print('[INFO] Pipeline wrote {} images in {:.1f}s ({:.2f} images/s)'.format(
+            written, elapsed, written / elapsed if elapsed else 0))
+        for counter in self.counters.values():
+            print('[INFO] ' + str(counter))
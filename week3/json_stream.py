@@ -0,0 +1,106 @@
+import json
+
+CHUNK_SIZE = 1 << 20
+
+
+def iter_json_lines(json_path):
+    '''
+    Yields the records of a line-delimited JSON file, like the metrics.json
+    written by detectron2, one at a time. A last line cut by an interrupted
+    training is skipped.
+    '''
+    with open(json_path, 'r') as f:
+        pending = None
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if pending is not None:
+                raise ValueError('Invalid JSON line in ' + json_path)
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                pending = line  # only allowed as the last line
+
+
+def iter_json_array(json_path, chunk_size=CHUNK_SIZE):
+    '''
+    Yields the items of a file holding one JSON array, like
+    coco_instances_results.json, decoding it chunk by chunk so that only
+    one chunk and one item are in memory at a time.
+    '''
+    decoder = json.JSONDecoder()
+    with open(json_path, 'r') as f:
+        buf = ''
+        while not buf:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf = chunk.lstrip()
+        if not buf.startswith('['):
+            raise ValueError(json_path + ' does not hold a JSON array')
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            if end is not None:
+                # an item is complete only once the ',' or ']' after it is read: a number
+                # cut by the chunk boundary (before its '.' or exponent) decodes too early
+                after = end
+                while after < len(buf) and buf[after] in ' \t\r\n':
+                    after += 1
+                if after == len(buf) or buf[after] not in ',]':
+                    end = None
+            if end is None:
+                if eof:
+                    raise ValueError('Truncated JSON array in ' + json_path)
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+            pos = end
+
+
+def iter_json(json_path, chunk_size=CHUNK_SIZE):
+    '''
+    Items of a JSON array file or records of a line-delimited JSON file,
+    depending on the first character of the file.
+    '''
+    with open(json_path, 'r') as f:
+        start = f.read(64).lstrip()
+    if start.startswith('['):
+        return iter_json_array(json_path, chunk_size)
+    return iter_json_lines(json_path)
+
+
+if __name__ == "__main__":
+    # round trip against json.load over small chunks, so that chunk boundaries fall inside every item:
+    # python json_stream.py [coco_instances_results.json ...]
+    import os
+    import sys
+    import tempfile
+
+    samples = ['[1.5]', '[-1.5e10, 2, 3.25E-3]', ' \n [ ]', '[{"a": [1, 2.5], "b": "x,]"}, 7, "s", null, true]']
+    paths = sys.argv[1:]
+    tmp_dir = tempfile.mkdtemp()
+    for i, sample in enumerate(samples if not paths else []):
+        paths.append(os.path.join(tmp_dir, '{}.json'.format(i)))
+        with open(paths[-1], 'w') as f:
+            f.write(sample)
+
+    for path in paths:
+        with open(path) as f:
+            expected = json.load(f)
+        for chunk_size in (1, 2, 3, 5, 7, 64, CHUNK_SIZE):
+            if list(iter_json_array(path, chunk_size)) != expected:
+                raise SystemExit('[ERROR] {} differs from json.load with chunk_size {}'.format(path, chunk_size))
+    print('[INFO] {} files read as by json.load'.format(len(paths)))
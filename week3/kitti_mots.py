@@ -0,0 +1,122 @@
+import PIL.Image as Image
+import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from instance_utils import read_annotations
+
+dataset_path = {
+    'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02',
+    'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/images'
+}
+gt_path = {
+    'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/instances',
+    'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/instances'
+}
+
+
+def read_split(split_file, skip=()):
+    '''
+    Read a split file listing one sequence folder per line, e.g.
+    /home/mcv/datasets/KITTI-MOTS/training/image_02/0000/
+    and return the [dataset, seq] pairs, leaving out the datasets in skip.
+    '''
+    with open(split_file, 'r') as f:
+        lines = [line.rstrip() for line in f]
+
+    dataset_seqs = []
+    for l in lines:
+        dataset = l.split('datasets/')[1].split('/')[0]
+        seq = l.split('/')[-2]
+        if dataset in skip:
+            continue
+        dataset_seqs.append([dataset, seq])
+
+    return dataset_seqs
+
+
+def list_frames(dataset, seq):
+    # (image, ground truth) file names of a sequence, sorted by frame
+    frames = []
+    for img_name in sorted(os.listdir(os.path.join(dataset_path[dataset], seq))):
+
+        if 'png' not in img_name and 'jpg' not in img_name:
+            continue
+
+        filename = os.path.join(dataset_path[dataset], seq, img_name)
+        gt_filename = os.path.join(gt_path[dataset], seq, img_name.split('.')[0]+'.png')
+        frames.append((filename, gt_filename))
+
+    return frames
+
+
+def load_frame(filename, gt_filename, map_classes, mask_format=None, timings=None):
+    record = {}
+    start = time.perf_counter()
+    gt = np.asarray(Image.open(gt_filename))
+    if timings is not None:
+        timings['decode'] = timings.get('decode', 0) + time.perf_counter() - start
+
+    height, width = gt.shape[:]
+
+    record["file_name"] = filename
+    record["image_id"] = filename
+    record["height"] = height
+    record["width"] = width
+
+    record["annotations"] = read_annotations(gt, map_classes, mask_format, timings=timings)
+    return record
+
+
+def _load_chunk(frames, map_classes, mask_format):
+    # runs in the worker processes: only the file names go in and the records come out
+    timings = {}
+    records = [load_frame(filename, gt_filename, map_classes, mask_format, timings)
+               for filename, gt_filename in frames]
+    return records, timings
+
+
+def load_frames(frames, map_classes, mask_format=None, num_workers=0, chunk_size=64):
+    '''
+    Load the records of a list of (image, ground truth) file names. With
+    num_workers > 0 the frames are split in chunks of consecutive frames of
+    the same sequence and loaded by a pool of processes. The records are
+    returned in the same order as frames in both cases.
+    '''
+    start = time.perf_counter()
+
+    chunks = []
+    for filename, gt_filename in frames:
+        seq_dir = os.path.dirname(gt_filename)
+        if not chunks or len(chunks[-1]) == chunk_size or os.path.dirname(chunks[-1][-1][1]) != seq_dir:
+            chunks.append([])
+        chunks[-1].append((filename, gt_filename))
+
+    if num_workers > 0:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_load_chunk, chunks, repeat(map_classes), repeat(mask_format)))
+    else:
+        results = [_load_chunk(chunk, map_classes, mask_format) for chunk in chunks]
+
+    dataset_dicts = []
+    timings = {'decode': 0, 'extract': 0, 'masks': 0}
+    for records, chunk_timings in results:
+        dataset_dicts.extend(records)
+        for stage, seconds in chunk_timings.items():
+            timings[stage] += seconds
+
+    print('[INFO] Loaded {} frames with {} workers in {:.1f}s (decode {:.1f}s, extract {:.1f}s, masks {:.1f}s)'.format(
+        len(dataset_dicts), num_workers, time.perf_counter() - start,
+        timings['decode'], timings['extract'], timings['masks']))
+
+    return dataset_dicts
+
+
+def load_dataset(split_file, map_classes, mask_format=None, skip=(), num_workers=0):
+    frames = []
+    for dataset, seq in read_split(split_file, skip):
+        frames.extend(list_frames(dataset, seq))
+
+    return load_frames(frames, map_classes, mask_format, num_workers)
@@ -3,6 +3,8 @@ import numpy as np
 import pycocotools.mask as rletools
 import glob
 import os
+import argparse
+from collections.abc import Mapping
 
 
 class SegmentedObject:
@@ -12,26 +14,125 @@ class SegmentedObject:
     self.track_id = track_id
 
 
-def load_sequences(path, seqmap):
+class SegmentedObjectView:
+  """
+  Read-only SegmentedObject backed by one row of a SegmentedObjects store.
+  """
+  __slots__ = ("_store", "_row")
+
+  def __init__(self, store, row):
+    self._store = store
+    self._row = row
+
+  @property
+  def mask(self):
+    return self._store.mask(self._row)
+
+  @property
+  def class_id(self):
+    return int(self._store.class_ids[self._row])
+
+  @property
+  def track_id(self):
+    return int(self._store.track_ids[self._row])
+
+
+class SegmentedObjects(Mapping):
+  """
+  Columnar storage of all the objects of a sequence: one NumPy array per
+  field and the RLE counts of every mask concatenated in a single bytes
+  buffer indexed by offsets. It behaves like the {frame: [SegmentedObject]}
+  dicts returned by load_txt, but the per frame lists are made of
+  SegmentedObjectView created on access.
+  """
+  def __init__(self, frames, track_ids, class_ids, heights, widths, counts, offsets):
+    # rows are kept sorted by frame (stable, so the file order is kept within a frame)
+    order = np.argsort(frames, kind="stable")
+    if (order != np.arange(len(order))).any():
+      counts = b"".join(counts[offsets[i]:offsets[i + 1]] for i in order)
+      offsets = np.concatenate([[0], np.cumsum(np.diff(offsets)[order])])
+      frames, track_ids, class_ids, heights, widths = (
+        a[order] for a in (frames, track_ids, class_ids, heights, widths))
+
+    self.frames = np.asarray(frames, dtype=np.int32)
+    self.track_ids = np.asarray(track_ids, dtype=np.int32)
+    self.class_ids = np.asarray(class_ids, dtype=np.int8)
+    self.heights = np.asarray(heights, dtype=np.int32)
+    self.widths = np.asarray(widths, dtype=np.int32)
+    self.counts = counts
+    self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    self._frame_ids, self._frame_starts = np.unique(self.frames, return_index=True)
+    self._frame_ends = np.r_[self._frame_starts[1:], len(self.frames)].astype(np.int64)
+
+  @classmethod
+  def from_objects(cls, objects_per_frame):
+    rows = [(t, obj) for t, objects in objects_per_frame.items() for obj in objects]
+    counts = [obj.mask["counts"] for _, obj in rows]
+    return cls(
+      np.array([t for t, _ in rows], dtype=np.int32),
+      np.array([obj.track_id for _, obj in rows], dtype=np.int32),
+      np.array([obj.class_id for _, obj in rows], dtype=np.int8),
+      np.array([obj.mask["size"][0] for _, obj in rows], dtype=np.int32),
+      np.array([obj.mask["size"][1] for _, obj in rows], dtype=np.int32),
+      b"".join(counts),
+      np.concatenate([[0], np.cumsum([len(c) for c in counts])]),
+    )
+
+  def mask(self, row):
+    return {'size': [int(self.heights[row]), int(self.widths[row])],
+            'counts': self.counts[self.offsets[row]:self.offsets[row + 1]]}
+
+  def rows(self, frame):
+    i = np.searchsorted(self._frame_ids, frame)
+    if i == len(self._frame_ids) or self._frame_ids[i] != frame:
+      raise KeyError(frame)
+    return range(self._frame_starts[i], self._frame_ends[i])
+
+  def __getitem__(self, frame):
+    return [SegmentedObjectView(self, row) for row in self.rows(frame)]
+
+  def __iter__(self):
+    return iter(self._frame_ids.tolist())
+
+  def __len__(self):
+    return len(self._frame_ids)
+
+  @property
+  def num_objects(self):
+    return len(self.frames)
+
+
+def load_sequences(path, seqmap, columnar=False):
   objects_per_frame_per_sequence = {}
   for seq in seqmap:
     print("Loading sequence", seq)
     seq_path_folder = os.path.join(path, seq)
     seq_path_txt = os.path.join(path, seq + ".txt")
     if os.path.isdir(seq_path_folder):
-      objects_per_frame_per_sequence[seq] = load_images_for_folder(seq_path_folder)
+      objects_per_frame_per_sequence[seq] = load_images_for_folder(seq_path_folder, columnar)
     elif os.path.exists(seq_path_txt):
-      objects_per_frame_per_sequence[seq] = load_txt(seq_path_txt)
+      objects_per_frame_per_sequence[seq] = load_txt(seq_path_txt, columnar=columnar)
     else:
       assert False, "Can't find data in directory " + path
 
   return objects_per_frame_per_sequence
 
 
-def load_txt(path):
+def load_txt(path, validate=True, columnar=False):
+  """
+  Load a MOTS instances_txt file as {frame: [SegmentedObject, ...]}, or as a
+  SegmentedObjects store with columnar=True. The consistency checks of
+  validate_objects can be skipped with validate=False when the file is known
+  to be valid.
+  """
+  if columnar:
+    objects_per_frame = load_txt_columnar(path)
+    if validate:
+      validate_objects(objects_per_frame)
+    return objects_per_frame
+
   objects_per_frame = {}
-  track_ids_per_frame = {}  # To check that no frame contains two objects with same id
-  combined_mask_per_frame = {}  # To check that no frame contains overlapping masks
   with open(path, "r") as f:
     for line in f:
       line = line.strip()
@@ -40,34 +141,149 @@ def load_txt(path):
       frame = int(fields[0])
       if frame not in objects_per_frame:
         objects_per_frame[frame] = []
-      if frame not in track_ids_per_frame:
-        track_ids_per_frame[frame] = set()
-      if int(fields[1]) in track_ids_per_frame[frame]:
-        assert False, "Multiple objects with track id " + fields[1] + " in frame " + fields[0]
-      else:
-        track_ids_per_frame[frame].add(int(fields[1]))
 
       class_id = int(fields[2])
       if not(class_id == 1 or class_id == 2 or class_id == 10):
         assert False, "Unknown object class " + fields[2]
 
       mask = {'size': [int(fields[3]), int(fields[4])], 'counts': fields[5].encode(encoding='UTF-8')}
-      if frame not in combined_mask_per_frame:
-        combined_mask_per_frame[frame] = mask
-      elif rletools.area(rletools.merge([combined_mask_per_frame[frame], mask], intersect=True)) > 0.0:
-        assert False, "Objects with overlapping masks in frame " + fields[0]
-      else:
-        combined_mask_per_frame[frame] = rletools.merge([combined_mask_per_frame[frame], mask], intersect=False)
       objects_per_frame[frame].append(SegmentedObject(
         mask,
         class_id,
         int(fields[1])
       ))
 
+  if validate:
+    validate_objects(objects_per_frame)
+
   return objects_per_frame
 
 
-def load_images_for_folder(path):
+def load_txt_columnar(path):
+  frames, track_ids, class_ids, heights, widths, counts = [], [], [], [], [], []
+  with open(path, "rb") as f:
+    for line in f:
+      fields = line.split()
+      frames.append(int(fields[0]))
+      track_ids.append(int(fields[1]))
+      class_ids.append(int(fields[2]))
+      heights.append(int(fields[3]))
+      widths.append(int(fields[4]))
+      counts.append(fields[5])
+
+  class_ids = np.array(class_ids, dtype=np.int8)
+  unknown = ~np.isin(class_ids, [1, 2, 10])
+  if unknown.any():
+    assert False, "Unknown object class " + str(class_ids[unknown][0])
+
+  return SegmentedObjects(
+    np.array(frames, dtype=np.int32),
+    np.array(track_ids, dtype=np.int32),
+    class_ids,
+    np.array(heights, dtype=np.int32),
+    np.array(widths, dtype=np.int32),
+    b"".join(counts),
+    np.concatenate([[0], np.cumsum([len(c) for c in counts], dtype=np.int64)]),
+  )
+
+
+_txt_indexes = {}  # (path, mtime, size) -> (frames, byte offsets of their first line)
+
+
+def _parse_line(line):
+  fields = line.split()
+  class_id = int(fields[2])
+  if not(class_id == 1 or class_id == 2 or class_id == 10):
+    assert False, "Unknown object class " + fields[2].decode()
+  mask = {'size': [int(fields[3]), int(fields[4])], 'counts': fields[5]}
+  return int(fields[0]), SegmentedObject(mask, class_id, int(fields[1]))
+
+
+def txt_index(path):
+  """
+  Byte offset of the first line of every frame of a MOTS instances_txt file
+  (which lists the frames in increasing order). The index is built once per
+  version of the file, by iter_txt or by scanning only the frame numbers.
+  """
+  st = os.stat(path)
+  key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+  if key not in _txt_indexes:
+    frames, offsets = [], []
+    offset = 0
+    with open(path, "rb") as f:
+      for line in f:
+        frame = int(line[:line.index(b" ")])
+        if not frames or frame != frames[-1]:
+          frames.append(frame)
+          offsets.append(offset)
+        offset += len(line)
+    _txt_indexes[key] = (np.array(frames), np.array(offsets))
+  return _txt_indexes[key]
+
+
+def iter_txt(path, start=None, stop=None):
+  """
+  Lazily yield (frame, [SegmentedObject, ...]) for the frames of a MOTS
+  instances_txt file, in file order and without validation. With start
+  and/or stop only the frames in [start, stop) are read, seeking directly to
+  the first one through txt_index.
+  """
+  st = os.stat(path)
+  key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+  build_index = start is None and key not in _txt_indexes
+  frames, offsets = [], []
+
+  with open(path, "rb") as f:
+    offset = 0
+    if start is not None:
+      index_frames, index_offsets = txt_index(path)
+      first = np.searchsorted(index_frames, start)
+      if first == len(index_frames):
+        return
+      offset = int(index_offsets[first])
+      f.seek(offset)
+
+    current, objects = None, []
+    for line in f:
+      frame, obj = _parse_line(line)
+      if build_index and frame != current:
+        frames.append(frame)
+        offsets.append(offset)
+      offset += len(line)
+
+      if frame != current:
+        if objects:
+          yield current, objects
+        if stop is not None and frame >= stop:
+          return
+        current, objects = frame, []
+      objects.append(obj)
+
+    if objects:
+      yield current, objects
+
+  # the whole file has been read, so the index comes for free
+  if build_index:
+    _txt_indexes[key] = (np.array(frames), np.array(offsets))
+
+
+def validate_objects(objects_per_frame):
+  for frame, objects in objects_per_frame.items():
+    # To check that no frame contains two objects with same id
+    track_ids = set()
+    for obj in objects:
+      if obj.track_id in track_ids:
+        assert False, "Multiple objects with track id " + str(obj.track_id) + " in frame " + str(frame)
+      track_ids.add(obj.track_id)
+
+    # To check that no frame contains overlapping masks: the masks are disjoint
+    # iff the area of their union is the sum of their areas
+    masks = [obj.mask for obj in objects]
+    if rletools.area(rletools.merge(masks, intersect=False)) != rletools.area(masks).sum():
+      assert False, "Objects with overlapping masks in frame " + str(frame)
+
+
+def load_images_for_folder(path, columnar=False):
   files = sorted(glob.glob(os.path.join(path, "*.png")))
 
   objects_per_frame = {}
@@ -76,36 +292,63 @@ def load_images_for_folder(path):
     frame = filename_to_frame_nr(os.path.basename(file))
     objects_per_frame[frame] = objects
 
+  if columnar:
+    return SegmentedObjects.from_objects(objects_per_frame)
   return objects_per_frame
 
 
+def iter_images_for_folder(path, start=None, stop=None):
+  """
+  Lazily yield (frame, [SegmentedObject, ...]) for the PNG instance maps of a
+  folder, optionally only for the frames in [start, stop).
+  """
+  for file in sorted(glob.glob(os.path.join(path, "*.png"))):
+    frame = filename_to_frame_nr(os.path.basename(file))
+    if start is not None and frame < start:
+      continue
+    if stop is not None and frame >= stop:
+      break
+    yield frame, load_image(file)
+
+
 def filename_to_frame_nr(filename):
   assert len(filename) == 10, "Expect filenames to have format 000000.png, 000001.png, ..."
   return int(filename.split('.')[0])
 
 
-def load_image(filename, id_divisor=1000):
+def load_image(filename, id_divisor=1000, batch_size=64):
   img = np.array(Image.open(filename))
-  obj_ids = np.unique(img)
+
+  # foreground pixels and the index of their object in obj_ids, found in a single pass
+  rows, cols = np.nonzero(img)
+  obj_ids, labels = np.unique(img[rows, cols], return_inverse=True)
+  labels = labels.ravel()
 
   objects = []
-  mask = np.zeros(img.shape, dtype=np.uint8, order="F")  # Fortran order needed for pycocos RLE tools
-  for idx, obj_id in enumerate(obj_ids):
-    if obj_id == 0:  # background
-      continue
-    mask.fill(0)
-    pixels_of_elem = np.where(img == obj_id)
-    mask[pixels_of_elem] = 1
-    objects.append(SegmentedObject(
-      rletools.encode(mask),
-      obj_id // id_divisor,
-      obj_id
-    ))
-
-  
+  for first in range(0, len(obj_ids), batch_size):
+    batch_ids = obj_ids[first:first + batch_size]
+    # all the masks of the batch stacked as one (H, W, N) Fortran ordered array, so
+    # that pycocotools encodes them in one call
+    masks = np.zeros(img.shape + (len(batch_ids),), dtype=np.uint8, order="F")
+    in_batch = (labels >= first) & (labels < first + len(batch_ids))
+    masks[rows[in_batch], cols[in_batch], labels[in_batch] - first] = 1
+    rles = rletools.encode(masks)
+
+    for obj_id, rle in zip(batch_ids, rles):
+      objects.append(SegmentedObject(
+        rle,
+        obj_id // id_divisor,
+        obj_id
+      ))
+
   return objects
 
 
+def encode_mask(mask):
+  # pycocotools needs a Fortran ordered uint8 array
+  return rletools.encode(np.asfortranarray(mask, dtype=np.uint8))
+
+
 def load_seqmap(seqmap_filename):
   print("Loading seqmap...")
   seqmap = []
@@ -127,8 +370,33 @@ def write_sequences(gt, output_folder):
 
 
 def write_sequence(frames, path):
+  if isinstance(frames, SegmentedObjects):
+    write_sequence_columnar(frames, path)
+    return
+
   with open(path, "w") as f:
     for t, objects in frames.items():
       for obj in objects:
         print(t, obj.track_id, obj.class_id, obj.mask["size"][0], obj.mask["size"][1],
-              obj.mask["counts"].decode(encoding='UTF-8'), file=f)
\ No newline at end of file
+              obj.mask["counts"].decode(encoding='UTF-8'), file=f)
+
+
+def write_sequence_columnar(objects, path):
+  with open(path, "wb") as f:
+    for row in range(objects.num_objects):
+      f.write(b"%d %d %d %d %d " % (objects.frames[row], objects.track_ids[row], objects.class_ids[row],
+                                    objects.heights[row], objects.widths[row]))
+      f.write(objects.counts[objects.offsets[row]:objects.offsets[row + 1]])
+      f.write(b"\n")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Tools for MOTS annotation files")
+  parser.add_argument("command", choices=["validate"],
+                      help="validate: check that no frame has repeated track ids or overlapping masks")
+  parser.add_argument("paths", nargs="+", help="instances_txt files")
+  args = parser.parse_args()
+
+  for path in args.paths:
+    validate_objects(load_txt(path, validate=False))
+    print(path, "OK")
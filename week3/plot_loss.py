@@ -1,20 +1,12 @@
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 
-experiment_folder = './results/faster_rcnn_R_50_FPN_3x/lr_0_001_iter_5000_batch_512/0/'
-
-def load_json_arr(json_path):
-    lines = []
-    with open(json_path, 'r') as f:
-        for line in f:
-            lines.append(json.loads(line))
-    return lines
+from json_stream import iter_json_lines
 
-experiment_metrics = load_json_arr(experiment_folder + 'metrics.json')
+experiment_folder = './results/faster_rcnn_R_50_FPN_3x/lr_0_001_iter_5000_batch_512/0/'
 
 train_loss = {}
-for x in experiment_metrics:
+for x in iter_json_lines(experiment_folder + 'metrics.json'):
     if 'total_loss' in x:
             train_loss[x['iteration']] = x['total_loss']
 
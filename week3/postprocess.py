@@ -0,0 +1,47 @@
+import torch
+
+from detectron2.layers import batched_nms
+
+
+def parse_class_thresholds(values):
+    '''
+    ['0:0.6', '2:0.4'] -> {0: 0.6, 2: 0.4}, for the --class_score arguments.
+    '''
+    thresholds = {}
+    for value in values or []:
+        class_id, thresh = value.split(':')
+        thresholds[int(class_id)] = float(thresh)
+    return thresholds
+
+
+def postprocess(instances, score_thresh=0.0, class_thresh=None, topk=None, nms_thresh=None):
+    '''
+    Filter the predictions of an image with tensor ops only. The Instances
+    are indexed, so every field (boxes, masks, ...) and the image size are kept.
+
+    score_thresh: minimum score of the detections
+    class_thresh: dict class id -> minimum score, overriding score_thresh
+    topk: keep at most the topk best scored detections
+    nms_thresh: IoU threshold of an extra class-aware NMS, None to skip it
+    '''
+    scores = instances.scores
+    classes = instances.pred_classes
+
+    if class_thresh:
+        num_classes = max(max(class_thresh) + 1, int(classes.max()) + 1 if len(classes) else 0)
+        thresholds = torch.full((num_classes,), score_thresh, dtype=scores.dtype, device=scores.device)
+        thresholds[list(class_thresh)] = torch.tensor(list(class_thresh.values()), dtype=scores.dtype,
+                                                      device=scores.device)
+        keep = scores >= thresholds[classes]
+    else:
+        keep = scores >= score_thresh
+    instances = instances[keep]
+
+    if nms_thresh is not None:
+        # indices sorted by decreasing score
+        keep = batched_nms(instances.pred_boxes.tensor, instances.scores, instances.pred_classes, nms_thresh)
+        instances = instances[keep[:topk] if topk else keep]
+    elif topk and len(instances) > topk:
+        instances = instances[instances.scores.topk(topk).indices]
+
+    return instances
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pycocotools.mask as rletools
+import torch
+
+from detectron2.structures import Boxes, Instances
+
+INDEX_NAME = 'index.json'
+
+
+def _offsets(lengths):
+    return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+
+def encode_masks(masks):
+    '''
+    COCO RLEs of a (N, H, W) stack of binary masks, encoded in a single
+    pycocotools call.
+    '''
+    masks = np.asarray(masks)
+    if len(masks) == 0:
+        return []
+    return rletools.encode(np.asfortranarray(masks.transpose(1, 2, 0), dtype=np.uint8))
+
+
+class PredictionWriter:
+    '''
+    Collects the predictions of a sequence and writes them as one columnar
+    .npz shard: the detections of all images are concatenated and indexed
+    by offsets, masks are stored as the bytes of their COCO RLEs. The shard
+    is listed in the index.json of its folder when it is closed.
+
+    Called as writer(input_path, output_path, instances) from the inference
+    pipeline, predictions are stored under the file name of the input.
+    With keep_existing=True the images already in the shard are kept unless
+    they are predicted again (runs resumed with InferenceManifest). The
+    outputs are recorded in the manifest when the shard is written. Thread-safe.
+    '''
+    def __init__(self, dump_dir, shard, keep_existing=False, manifest=None, config=None):
+        self.dump_dir = dump_dir
+        self.shard = shard
+        self.path = os.path.join(dump_dir, shard + '.npz')
+        self.manifest = manifest
+        self.config = config
+        self.predictions = {}
+        self.output_paths = []
+        self.has_masks = False
+        self._lock = threading.Lock()
+
+        if keep_existing and os.path.exists(self.path):
+            existing = PredictionShard(self.path)
+            for name in existing.names:
+                self.predictions[name] = existing.arrays(name)
+            self.has_masks = existing.has_masks
+
+    def __call__(self, input_path, output_path, instances):
+        height, width = instances.image_size
+        prediction = {
+            'height': height,
+            'width': width,
+            'boxes': instances.pred_boxes.tensor.numpy() if instances.has('pred_boxes') else np.zeros((0, 4)),
+            'scores': instances.scores.numpy(),
+            'classes': instances.pred_classes.numpy(),
+            'rles': [rle['counts'] for rle in encode_masks(instances.pred_masks)]
+            if instances.has('pred_masks') else [],
+        }
+        with self._lock:
+            self.has_masks |= instances.has('pred_masks')
+            self.predictions[os.path.basename(input_path)] = prediction
+            self.output_paths.append(output_path)
+
+    def close(self):
+        with self._lock:
+            names = sorted(self.predictions)
+            preds = [self.predictions[name] for name in names]
+            encoded = [name.encode() for name in names]
+            rles = [rle for p in preds for rle in p['rles']]
+            arrays = {
+                'names': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                'name_offsets': _offsets([len(n) for n in encoded]),
+                'heights': np.array([p['height'] for p in preds], dtype=np.int32),
+                'widths': np.array([p['width'] for p in preds], dtype=np.int32),
+                'det_offsets': _offsets([len(p['scores']) for p in preds]),
+                'boxes': np.concatenate([p['boxes'] for p in preds] or [np.zeros((0, 4))]).astype(np.float32),
+                'scores': np.concatenate([p['scores'] for p in preds] or [[]]).astype(np.float32),
+                'classes': np.concatenate([p['classes'] for p in preds] or [[]]).astype(np.int32),
+                'mask_offsets': _offsets([len(p['rles']) for p in preds]),
+                'rle_offsets': _offsets([len(c) for c in rles]),
+                'rle_counts': np.frombuffer(b''.join(rles), dtype=np.uint8),
+                'has_masks': np.array(self.has_masks),
+            }
+
+            os.makedirs(self.dump_dir, exist_ok=True)
+            tmp_path = self.path + '.tmp{}.npz'.format(os.getpid())
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, self.path)
+            update_index(self.dump_dir, self.shard, {
+                'file': os.path.basename(self.path),
+                'images': len(names),
+                'detections': len(arrays['scores']),
+                'config': self.config,
+            })
+
+            if self.manifest is not None:
+                for output_path in self.output_paths:
+                    self.manifest.mark_done(output_path, self.path)
+            print('[INFO] Wrote predictions of {} images to {}'.format(len(names), self.path))
+
+
+def update_index(dump_dir, shard, entry):
+    index = load_index(dump_dir)
+    index[shard] = entry
+    tmp_path = os.path.join(dump_dir, INDEX_NAME + '.tmp{}'.format(os.getpid()))
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dump_dir, INDEX_NAME))
+
+
+def load_index(dump_dir):
+    '''
+    shard name -> {"file", "images", "detections", "config"} of a dump folder
+    '''
+    path = os.path.join(dump_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+class PredictionShard:
+    '''
+    Read access to a shard written by PredictionWriter. The columns are
+    loaded once, so thresholding or exporting a whole sequence only touches
+    NumPy arrays; masks are only decoded by instances().
+    '''
+    def __init__(self, path):
+        self.path = path
+        with np.load(path) as data:
+            self._arrays = {name: data[name] for name in data.files}
+        a = self._arrays
+        names = bytes(a['names'])
+        self.names = [names[start:end].decode() for start, end in zip(a['name_offsets'][:-1], a['name_offsets'][1:])]
+        self._rows = {name: i for i, name in enumerate(self.names)}
+        self.has_masks = bool(a['has_masks'])
+
+    @classmethod
+    def open(cls, dump_dir, shard):
+        return cls(os.path.join(dump_dir, load_index(dump_dir)[shard]['file']))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def column(self, name):
+        '''
+        Column of all the detections of the shard ('boxes', 'scores',
+        'classes') or of all the images ('heights', 'widths', 'det_offsets').
+        '''
+        return self._arrays[name]
+
+    def arrays(self, name):
+        '''
+        Predictions of an image as {"height", "width", "boxes", "scores", "classes", "rles"}
+        where rles holds the RLE counts bytes of the masks, if any.
+        '''
+        a = self._arrays
+        i = self._rows[name]
+        start, end = a['det_offsets'][i:i + 2]
+        mask_start, mask_end = a['mask_offsets'][i:i + 2]
+        counts = a['rle_counts']
+        rle_offsets = a['rle_offsets']
+        return {
+            'height': int(a['heights'][i]),
+            'width': int(a['widths'][i]),
+            'boxes': a['boxes'][start:end],
+            'scores': a['scores'][start:end],
+            'classes': a['classes'][start:end],
+            'rles': [bytes(counts[rle_offsets[j]:rle_offsets[j + 1]]) for j in range(mask_start, mask_end)],
+        }
+
+    def instances(self, name, score_thresh=0.0, masks=True):
+        '''
+        Predictions of an image as detectron2 Instances, as returned by the model.
+        '''
+        p = self.arrays(name)
+        keep = np.nonzero(p['scores'] >= score_thresh)[0]
+        instances = Instances((p['height'], p['width']))
+        instances.pred_boxes = Boxes(torch.as_tensor(p['boxes'][keep]))
+        instances.scores = torch.as_tensor(p['scores'][keep])
+        instances.pred_classes = torch.as_tensor(p['classes'][keep], dtype=torch.int64)
+        if masks and self.has_masks:
+            if len(keep):
+                size = [p['height'], p['width']]
+                rles = [{'size': size, 'counts': p['rles'][i]} for i in keep]
+                decoded = rletools.decode(rles).transpose(2, 0, 1)
+            else:
+                decoded = np.zeros((0, p['height'], p['width']), dtype=np.uint8)
+            instances.pred_masks = torch.as_tensor(decoded.astype(bool))
+        return instances
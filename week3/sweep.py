@@ -0,0 +1,271 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import torch
+
+from detectron2 import model_zoo
+from detectron2.config import get_cfg
+from detectron2.data import DatasetCatalog, MetadataCatalog
+from detectron2.evaluation import COCOEvaluator
+
+from batch_predictor import BatchPredictor
+from dataset_cache import load_cached
+
+SPLIT_PATH = '/home/group02/week3/data/split/kitti_mots_{}.txt'
+# KITTI-MOTS car and pedestrian to the car and person ids of COCO and Cityscapes
+MAP_CLASSES = {1: 2, 2: 0}
+
+
+def model_cfg(model, device):
+    cfg = get_cfg()
+    cfg.merge_from_file(model_zoo.get_config_file(model))
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
+    cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(model)
+    cfg.MODEL.DEVICE = device
+    return cfg
+
+
+def register_split(split, train_dataset, mask_format='polygon', num_workers=0):
+    '''
+    Register the KITTI-MOTS split with the classes of the dataset a model was
+    trained on, so that COCOEvaluator maps the predicted classes correctly.
+    '''
+    name = 'KITTI-MOTS_{}_{}'.format(split, train_dataset)
+    if name not in DatasetCatalog.list():
+        DatasetCatalog.register(name, lambda: load_cached(SPLIT_PATH.format(split), MAP_CLASSES,
+                                                          mask_format=mask_format, num_workers=num_workers))
+        MetadataCatalog.get(name).set(thing_classes=MetadataCatalog.get(train_dataset).thing_classes)
+    return name
+
+
+class ModelRunner:
+    '''
+    One model of the sweep: runs it on the frames it is given and feeds the
+    outputs to its own COCOEvaluator, timing only the model.
+    '''
+    def __init__(self, model, split, output, device, mask_format='polygon', num_workers=0):
+        self.model = model
+        cfg = model_cfg(model, device)
+        self.dataset = register_split(split, cfg.DATASETS.TRAIN[0], mask_format, num_workers)
+        cfg.DATASETS.TEST = (self.dataset,)
+        cfg.OUTPUT_DIR = os.path.join(output, os.path.splitext(model)[0])
+        os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
+
+        self.device = device
+        self.predictor = BatchPredictor(cfg)
+        self.evaluator = COCOEvaluator(self.dataset, cfg, False, output_dir=cfg.OUTPUT_DIR)
+        self.evaluator.reset()
+        self.seconds = 0.0
+        self.images = 0
+
+    def process(self, image_id, height, width, im):
+        start = time.perf_counter()
+        outputs = self.predictor([im])
+        if self.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        self.seconds += time.perf_counter() - start
+        self.images += 1
+        self.evaluator.process([{"image_id": image_id, "height": height, "width": width}], outputs)
+
+    def results(self):
+        return {
+            'metrics': self.evaluator.evaluate(),
+            'images': self.images,
+            'inference_seconds': self.seconds,
+            'ms_per_image': 1e3 * self.seconds / self.images if self.images else None,
+        }
+
+
+def list_frames(split, mask_format, num_workers):
+    dicts = load_cached(SPLIT_PATH.format(split), MAP_CLASSES, mask_format=mask_format, num_workers=num_workers)
+    return [(r["file_name"], r["image_id"], r["height"], r["width"]) for r in dicts]
+
+
+def run_sequential(models, frames, options):
+    # every decoded frame goes through all the models before the next one is read
+    runners = [ModelRunner(model, **options) for model in models]
+    decode_seconds = 0.0
+    for file_name, image_id, height, width in frames:
+        start = time.perf_counter()
+        im = cv2.imread(file_name)
+        decode_seconds += time.perf_counter() - start
+        for runner in runners:
+            runner.process(image_id, height, width, im)
+    return {runner.model: runner.results() for runner in runners}, decode_seconds
+
+
+def _worker(model, options, shm_name, slots_shape, threads, frames_queue, acks, results):
+    torch.set_num_threads(threads)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        runner = ModelRunner(model, **options)
+        while True:
+            message = frames_queue.get()
+            if message is None:
+                break
+            slot, image_id, height, width = message
+            # the model copies the frame while resizing it, the slot is free again once it returns
+            runner.process(image_id, height, width, slots[slot, :height, :width])
+            acks.put(slot)
+        results.put((model, runner.results()))
+    finally:
+        del slots
+        shm.close()
+
+
+def run_processes(models, frames, options, num_slots=8):
+    '''
+    One process per model. Each frame is decoded once into a slot of a
+    shared memory ring and read in place by every model process; a slot is
+    reused once all the models acknowledged it.
+    '''
+    max_height = max(f[2] for f in frames)
+    max_width = max(f[3] for f in frames)
+    slots_shape = (num_slots, max_height, max_width, 3)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(slots_shape)))
+    slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+
+    ctx = mp.get_context('spawn')  # CUDA can not be used in forked processes
+    acks = ctx.Queue()
+    results = ctx.Queue()
+    frames_queues = [ctx.Queue() for _ in models]
+    threads = max(1, torch.get_num_threads() // len(models))
+    procs = [ctx.Process(target=_worker, args=(model, options, shm.name, slots_shape, threads, q, acks, results))
+             for model, q in zip(models, frames_queues)]
+    for p in procs:
+        p.start()
+
+    def wait_ack():
+        while True:
+            try:
+                return acks.get(timeout=5)
+            except queue.Empty:
+                if not all(p.is_alive() for p in procs):
+                    raise RuntimeError('A model process of the sweep died')
+
+    try:
+        free = list(range(num_slots))
+        refs = [0] * num_slots
+        decode_seconds = 0.0
+        for file_name, image_id, height, width in frames:
+            while not free:
+                slot = wait_ack()
+                refs[slot] -= 1
+                if refs[slot] == 0:
+                    free.append(slot)
+            slot = free.pop()
+
+            start = time.perf_counter()
+            slots[slot, :height, :width] = cv2.imread(file_name)
+            decode_seconds += time.perf_counter() - start
+
+            refs[slot] = len(models)
+            for q in frames_queues:
+                q.put((slot, image_id, height, width))
+
+        for q in frames_queues:
+            q.put(None)
+        report = {}
+        while len(report) < len(models):
+            try:
+                model, model_results = results.get(timeout=5)
+                report[model] = model_results
+            except queue.Empty:
+                if not all(p.is_alive() for p in procs) and results.empty():
+                    raise RuntimeError('A model process of the sweep died')
+        for p in procs:
+            p.join()
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        del slots
+        shm.close()
+        shm.unlink()
+
+    return {model: report[model] for model in models}, decode_seconds
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Evaluate several model zoo models on KITTI-MOTS, '
+                                                 'decoding every image only once')
+
+    parser.add_argument('--models', type=str, nargs='+',
+                        default=['COCO-Detection/faster_rcnn_R_50_FPN_3x.yaml',
+                                 'COCO-Detection/faster_rcnn_X_101_32x8d_FPN_3x.yaml',
+                                 'COCO-Detection/retinanet_R_101_FPN_3x.yaml'],
+                        help='model zoo configs to evaluate')
+
+    parser.add_argument('--split', type=str, default='test',
+                        help='KITTI-MOTS split to evaluate on')
+
+    parser.add_argument('--mode', type=str, default='sequential', choices=['sequential', 'processes'],
+                        help='run all the models in this process or one process per model')
+
+    parser.add_argument('--slots', type=int, default=8,
+                        help='frames of the shared memory ring in processes mode')
+
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device the models run on')
+
+    parser.add_argument('--output', type=str, default='/home/group02/week3/results/sweep',
+                        help='output path of the evaluations and the sweep report')
+
+    parser.add_argument('--mask_format', type=str, default='polygon', choices=['polygon', 'bitmask'],
+                        help='store the ground truth masks as contour polygons or COCO RLE')
+
+    parser.add_argument('--load_workers', type=int, default=os.cpu_count(),
+                        help='processes used to parse the ground truth when it is not cached')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    os.makedirs(args.output, exist_ok=True)
+
+    options = {
+        'split': args.split,
+        'output': args.output,
+        'device': args.device,
+        'mask_format': args.mask_format,
+        'num_workers': args.load_workers,
+    }
+    frames = list_frames(args.split, args.mask_format, args.load_workers)
+    print('[INFO] Evaluating {} models on {} frames'.format(len(args.models), len(frames)))
+
+    start = time.perf_counter()
+    if args.mode == 'sequential':
+        report, decode_seconds = run_sequential(args.models, frames, options)
+    else:
+        report, decode_seconds = run_processes(args.models, frames, options, args.slots)
+    wall_seconds = time.perf_counter() - start
+
+    print('{:>55} {:>8} {:>8} {:>12}'.format('model', 'bbox AP', 'segm AP', 'ms/image'))
+    for model, results in report.items():
+        metrics = results['metrics']
+        print('{:>55} {:>8.2f} {:>8} {:>12.1f}'.format(
+            model, metrics.get('bbox', {}).get('AP', float('nan')),
+            '{:.2f}'.format(metrics['segm']['AP']) if 'segm' in metrics else '-', results['ms_per_image']))
+    print('[INFO] Decoding took {:.1f}s, the sweep {:.1f}s'.format(decode_seconds, wall_seconds))
+
+    report_path = os.path.join(args.output, 'sweep_{}.json'.format(args.split))
+    with open(report_path, 'w') as f:
+        json.dump({
+            'mode': args.mode,
+            'device': args.device,
+            'frames': len(frames),
+            'decode_seconds': decode_seconds,
+            'wall_seconds': wall_seconds,
+            'models': report,
+        }, f, indent=2)
+    print('[INFO] Report written to ' + report_path)
@@ -1,4 +1,4 @@
-import sys, os, cv2
+import sys, os
 import torch
 assert torch.__version__.startswith("1.7")   # need to manually install torch 1.8 if Colab changes its default version
 from detectron2.utils.logger import setup_logger
@@ -6,13 +6,17 @@ setup_logger()
 
 # import some common detectron2 utilities
 from detectron2 import model_zoo
-from detectron2.engine import DefaultPredictor
 from detectron2.config import get_cfg
-from detectron2.utils.visualizer import Visualizer
-from detectron2.data import MetadataCatalog, DatasetCatalog
 
 import argparse
 
+sys.path.append('/home/group02/week3/code')
+from batch_predictor import BatchPredictor
+from frame_writers import make_writer
+from inference_manifest import MANIFEST_NAME, InferenceManifest, config_hash
+from prediction_store import PredictionWriter
+from inference_pipeline import InferencePipeline, visualizer_renderer
+
 def parse_args(args=sys.argv[1:]):
     parser = argparse.ArgumentParser()
 
@@ -22,6 +26,36 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--seq', type=str, default='0000',
                         help='sequence of KITTI-MOTS training set to run inference on')
 
+    parser.add_argument('--batch_size', '--batch-size', type=int, default=1,
+                        help='number of images of the same size given to the model at once')
+
+    parser.add_argument('--queue_size', type=int, default=8,
+                        help='maximum number of images waiting between two pipeline stages')
+
+    parser.add_argument('--render_workers', type=int, default=2,
+                        help='threads drawing the predictions')
+
+    parser.add_argument('--render_processes', type=int, default=0,
+                        help='processes drawing the predictions, 0 to draw in the render threads')
+
+    parser.add_argument('--output_mode', type=str, default='images', choices=['images', 'video', 'none'],
+                        help='write one image per frame, one video per sequence or no rendered output')
+
+    parser.add_argument('--video_codec', type=str, default='mp4v', choices=['mp4v', 'avc1', 'MJPG'],
+                        help='codec of the video output mode')
+
+    parser.add_argument('--video_quality', type=int, default=None,
+                        help='quality (0-100) of the video output mode, for the codecs supporting it (MJPG)')
+
+    parser.add_argument('--stills', type=int, default=0,
+                        help='in video output mode, also write every n-th frame as an image, 0 for none')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the images already processed with the same configuration by a previous run')
+
+    parser.add_argument('--dump', action='store_true',
+                        help='also store the raw predictions (boxes, scores, classes, RLE masks) in <output>/predictions')
+
     return parser.parse_args(args)
 
 if __name__ == '__main__':
@@ -37,27 +71,33 @@ if __name__ == '__main__':
     cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
 
     cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(model_path)
-    predictor = DefaultPredictor(cfg)
+    predictor = BatchPredictor(cfg, args.batch_size)
 
     results_dir = '/home/group02/week3/results/task_b/'
     data_path = '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02/' + args.seq
 
     cfg.OUTPUT_DIR = results_dir + args.model + '/' + args.seq
 
-    for subdir, dirs, files in os.walk(data_path):
-        os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
-        for file in files:
-            input_path = os.path.join(subdir, file)
-            output_path = os.path.join(cfg.OUTPUT_DIR, file)
-
-            im = cv2.imread(input_path)
-
-            outputs = predictor(im)
+    os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
+    manifest = InferenceManifest(os.path.join(cfg.OUTPUT_DIR, MANIFEST_NAME),
+                                 config_hash(cfg, output_mode=args.output_mode, dump=args.dump), args.resume)
 
-            # print(outputs["instances"].pred_classes)
-            # print(outputs["instances"].pred_boxes)
-
-            # We can use `Visualizer` to draw the predictions on the image.
-            v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(cfg.DATASETS.TRAIN[0]), scale=1.2)
-            out = v.draw_instance_predictions(outputs["instances"].to("cpu"))
-            cv2.imwrite(output_path, out.get_image()[:, :, ::-1])
+    # decode, inference, drawing and writing of the images run concurrently
+    render = visualizer_renderer(cfg.DATASETS.TRAIN[0]) if args.output_mode != 'none' else None
+    for subdir, dirs, files in os.walk(data_path):
+        frame_paths = [os.path.join(cfg.OUTPUT_DIR, file) for file in sorted(files)]
+        writer = make_writer(args.output_mode, cfg.OUTPUT_DIR, args.seq, frame_paths,
+                             args.video_codec, args.video_quality, args.stills, None if args.dump else manifest)
+        # when dumping, the manifest follows the shard of predictions, written at the end of the sequence
+        dump = PredictionWriter(os.path.join(cfg.OUTPUT_DIR, 'predictions'), args.seq, args.resume, manifest,
+                                manifest.config_hash) if args.dump else None
+        pipeline = InferencePipeline(predictor, render, writer,
+                                     batch_size=args.batch_size, queue_size=args.queue_size,
+                                     render_workers=args.render_workers, render_processes=args.render_processes,
+                                     dump=dump)
+        jobs = [(os.path.join(subdir, file), os.path.join(cfg.OUTPUT_DIR, file)) for file in sorted(files)]
+        pipeline.run(manifest.pending(jobs, whole=args.output_mode == 'video'))
+        writer.close()
+        if dump is not None:
+            dump.close()
+    manifest.close()
@@ -1,4 +1,4 @@
-import sys, os, cv2
+import sys, os
 import torch
 assert torch.__version__.startswith("1.7")   # need to manually install torch 1.8 if Colab changes its default version
 from detectron2.utils.logger import setup_logger
@@ -6,15 +6,18 @@ setup_logger()
 
 # import some common detectron2 utilities
 from detectron2 import model_zoo
-from detectron2.engine import DefaultPredictor
 from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures.instances import Instances
-
 import argparse
 
+sys.path.append('/home/group02/week3/code')
+from batch_predictor import BatchPredictor
+from frame_writers import make_writer
+from inference_manifest import MANIFEST_NAME, InferenceManifest, config_hash
+from postprocess import parse_class_thresholds, postprocess
+
 def parse_args(args=sys.argv[1:]):
     parser = argparse.ArgumentParser()
 
@@ -24,9 +27,36 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--seq', type=str, default='0000',
                         help='sequence of KITTI-MOTS training set to run inference on')
 
+    parser.add_argument('--batch_size', '--batch-size', type=int, default=1,
+                        help='number of images of the same size given to the model at once')
+
     parser.add_argument('--score', type=float, default=0.5,
                         help='confidence threshold for detections')
 
+    parser.add_argument('--output_mode', type=str, default='images', choices=['images', 'video'],
+                        help='write one image per frame or one video per sequence')
+
+    parser.add_argument('--video_codec', type=str, default='mp4v', choices=['mp4v', 'avc1', 'MJPG'],
+                        help='codec of the video output mode')
+
+    parser.add_argument('--video_quality', type=int, default=None,
+                        help='quality (0-100) of the video output mode, for the codecs supporting it (MJPG)')
+
+    parser.add_argument('--stills', type=int, default=0,
+                        help='in video output mode, also write every n-th frame as an image, 0 for none')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the images already processed with the same configuration by a previous run')
+
+    parser.add_argument('--class_score', type=str, nargs='*', default=[],
+                        help='per class confidence thresholds as class_id:threshold, e.g. 0:0.6 2:0.4')
+
+    parser.add_argument('--topk', type=int, default=None,
+                        help='keep at most the k detections with the highest score per image')
+
+    parser.add_argument('--nms', type=float, default=None,
+                        help='IoU threshold of an extra class-aware NMS on the detections')
+
     return parser.parse_args(args)
 
 if __name__ == '__main__':
@@ -42,38 +72,30 @@ if __name__ == '__main__':
     cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
 
     cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(model_path)
-    predictor = DefaultPredictor(cfg)
+    predictor = BatchPredictor(cfg, args.batch_size)
 
     results_dir = '/home/group02/week3/results/task_b/'
     data_path = '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02/' + args.seq
 
     cfg.OUTPUT_DIR = results_dir + args.model + '_score' + str(args.score).replace('.', '_') + '/' + args.seq
 
-    for subdir, dirs, files in os.walk(data_path):
-        os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
-        for file in files:
-            input_path = os.path.join(subdir, file)
-            output_path = os.path.join(cfg.OUTPUT_DIR, file)
-
-            im = cv2.imread(input_path)
-
-            outputs = predictor(im)
+    class_thresh = parse_class_thresholds(args.class_score)
 
-            filtered_boxes = []
-            filtered_scores = []
-            filtered_classes = []
+    os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
+    manifest = InferenceManifest(os.path.join(cfg.OUTPUT_DIR, MANIFEST_NAME),
+                                 config_hash(cfg, score=args.score, class_score=args.class_score, topk=args.topk,
+                                             nms=args.nms, output_mode=args.output_mode), args.resume)
 
-            pred_boxes = outputs["instances"].pred_boxes.to("cpu")
-            scores = outputs["instances"].scores.to("cpu")
-            pred_classes = outputs["instances"].pred_classes.to("cpu")
-
-            for idx, s in enumerate(scores):
-                if s.item() >= args.score:
-                    filtered_boxes.append(pred_boxes[idx].tensor.numpy()[0])
-                    filtered_scores.append(scores[idx].item())
-                    filtered_classes.append(pred_classes[idx].item())
+    for subdir, dirs, files in os.walk(data_path):
+        frame_paths = [os.path.join(cfg.OUTPUT_DIR, file) for file in sorted(files)]
+        writer = make_writer(args.output_mode, cfg.OUTPUT_DIR, args.seq, frame_paths,
+                             args.video_codec, args.video_quality, args.stills, manifest)
+        jobs = [(os.path.join(subdir, file), os.path.join(cfg.OUTPUT_DIR, file)) for file in sorted(files)]
+        input_paths = [input_path for input_path, _ in manifest.pending(jobs, whole=args.output_mode == 'video')]
+        for input_path, im, outputs in predictor.predict_files(input_paths):
+            output_path = os.path.join(cfg.OUTPUT_DIR, os.path.basename(input_path))
 
-            filtered_outputs = Instances([256,256], pred_boxes=torch.tensor(filtered_boxes), scores=torch.tensor(filtered_scores), pred_classes=torch.tensor(filtered_classes))
+            filtered_outputs = postprocess(outputs["instances"].to("cpu"), args.score, class_thresh, args.topk, args.nms)
 
             # print(outputs["instances"].pred_classes)
             # print(outputs["instances"].pred_boxes)
@@ -81,4 +103,6 @@ if __name__ == '__main__':
             # We can use `Visualizer` to draw the predictions on the image.
             v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(cfg.DATASETS.TRAIN[0]), scale=1.2)
             out = v.draw_instance_predictions(filtered_outputs)
-            cv2.imwrite(output_path, out.get_image()[:, :, ::-1])
+            writer(output_path, out.get_image()[:, :, ::-1])
+        writer.close()
+    manifest.close()
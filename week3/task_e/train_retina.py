@@ -5,7 +5,6 @@ from detectron2.utils.logger import setup_logger
 setup_logger()
 
 # import some common libraries
-import numpy as np
 import os, json, cv2, random, sys
 # import some common detectron2 utilities
 from detectron2 import model_zoo
@@ -14,7 +13,6 @@ from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures import BoxMode
 from detectron2.engine import DefaultTrainer
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
@@ -26,79 +24,13 @@ from detectron2.modeling import build_model
 from detectron2.checkpoint import DetectionCheckpointer
 
 sys.path.append('/home/group02/week3/code')
-from mots_utils import *
-from LossEvalHook import *
-from MyTrainer import *
-
-def read_annotations(gt):
-    patterns = list(np.unique(gt))[1:-1]
-
-    objs = []
-    for pattern in patterns:
-        coords = np.argwhere(gt==pattern)
-
-        x0, y0 = coords.min(axis=0)
-        x1, y1 = coords.max(axis=0)
-
-        bbox = [y0, x0, y1, x1]
-
-        obj = {
-            "bbox": bbox,
-            "bbox_mode":BoxMode.XYXY_ABS,
-            "category_id": map_classes[int(np.floor(gt[coords[0][0]][coords[0][1]]/1e3))],
-            "iscrowd": 0
-        }
-
-        objs.append(obj)
-
-    return objs
-
-def load_dataset(type, thing_classes, map_classes):
-    dataset_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/images'
-    }
-    gt_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/instances',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/instances'
-    }
+from dataset_cache import load_cached
 
+def load_dataset(type, thing_classes, map_classes, num_workers=0):
     filepath = '/home/group02/week3/data/split/kitti_mots_' + type + '.txt'
 
-    with open(filepath, 'r') as f:
-        lines = [line.rstrip() for line in f]
-
-    dataset_seqs = []
-    for l in lines:
-        dataset = l.split('datasets/')[1].split('/')[0]
-        seq = l.split('/')[-2]
-        dataset_seqs.append([dataset, seq])
+    return load_cached(filepath, map_classes, num_workers=num_workers)
 
-    dataset_dicts = []
-    for dataset, seq in dataset_seqs:
-        for j, img_name in enumerate(os.listdir(os.path.join(dataset_path[dataset], seq))):
-
-            if 'png' not in img_name and 'jpg' not in img_name:
-                continue
-
-            record = {}
-            filename = os.path.join(dataset_path[dataset], seq, img_name)
-            gt_filename = os.path.join(gt_path[dataset], seq, img_name.split('.')[0]+'.png')
-
-            gt = np.asarray(Image.open(gt_filename))
-
-            height, width = gt.shape[:]
-
-            record["file_name"] = filename
-            # record["image_id"] = i+j
-            record["image_id"] = filename
-            record["height"] = height
-            record["width"] = width
-
-            record["annotations"] = read_annotations(gt)
-            dataset_dicts.append(record)
-
-    return dataset_dicts
 
 def parse_args(args=sys.argv[1:]):
     parser = argparse.ArgumentParser()
@@ -115,6 +47,9 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--batch', type=int, default=512,
                         help='batch size')
 
+    parser.add_argument('--load_workers', type=int, default=os.cpu_count(),
+                        help='processes used to parse the ground truth when it is not cached')
+
     return parser.parse_args(args)
 
 if __name__ == "__main__":
@@ -139,7 +74,7 @@ if __name__ == "__main__":
     dataset='KITTI-MOTS'
 
     for d in ['train', 'test']:
-        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d, thing_classes, map_classes))
+        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d, thing_classes, map_classes, args.load_workers))
         MetadataCatalog.get(dataset + '_' + d).set(thing_classes=thing_classes)
 
     metadata = MetadataCatalog.get(dataset + '_train')
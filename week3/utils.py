@@ -1,29 +1,31 @@
 from mots_utils import *
 from detectron2.structures import BoxMode
 
-def read_annotations(annotation_path):
-    annotation = load_txt(annotation_path)
+def read_annotations(annotation_path, validate=False):
+    # the files are validated separately with `python mots_utils.py validate <files>`
+    annotation = load_txt(annotation_path, validate)
 
     objs = {}
     for frame_id, objects in annotation.items():
-        frame_objs = []
-        for track in objects:
-            if track.track_id != 10000:
-
-                class_id = track.track_id //1000 # or track.class_id
-                instance_id = track.track_id % 1000
+        tracks = [track for track in objects if track.track_id != 10000]
+        if len(tracks) == 0:
+            continue
 
-                bbox = rletools.toBbox(track.mask)
+        # one toBbox call for all the objects of the frame
+        bboxes = rletools.toBbox([track.mask for track in tracks])
+        coco_bboxes = np.concatenate([bboxes[:, :2], bboxes[:, :2] + bboxes[:, 2:]], axis=1)
 
-                coco_bbox = np.array([bbox[0], bbox[1], bbox[0]+bbox[2], bbox[1]+bbox[3]])
+        frame_objs = []
+        for track, coco_bbox in zip(tracks, coco_bboxes):
+            class_id = track.track_id //1000 # or track.class_id
+            instance_id = track.track_id % 1000
 
-                obj = {
-                    "bbox" : coco_bbox,
-                    "bbox_mode" : BoxMode.XYXY_ABS,
-                    "category_id" : class_id
-                }
-                frame_objs.append(obj)
-        if len(frame_objs) != 0:
-            objs[frame_id] = frame_objs
+            obj = {
+                "bbox" : coco_bbox,
+                "bbox_mode" : BoxMode.XYXY_ABS,
+                "category_id" : class_id
+            }
+            frame_objs.append(obj)
+        objs[frame_id] = frame_objs
 
     return objs
@@ -5,8 +5,7 @@ from detectron2.utils.logger import setup_logger
 setup_logger()
 
 # import some common libraries
-import numpy as np
-import os, json, cv2, random, sys
+import os, json, random, sys
 # import some common detectron2 utilities
 from detectron2 import model_zoo
 from detectron2.engine import DefaultPredictor
@@ -14,7 +13,6 @@ from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures import BoxMode
 from detectron2.engine import DefaultTrainer
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
@@ -25,94 +23,14 @@ import argparse
 from detectron2.modeling import build_model
 from detectron2.checkpoint import DetectionCheckpointer
 
+sys.path.append('/home/group02/week3/code')
+from dataset_cache import load_cached
 
-def read_annotations(gt):
-    patterns = list(np.unique(gt))[1:-1]
 
-    objs = []
-    for pattern in patterns:
-        coords = np.argwhere(gt==pattern)
+def load_dataset(type, thing_classes, map_classes, mask_format='polygon', num_workers=0):
+    filepath = '/home/group02/week3/data/split/kitti_mots_' + type + '.txt'
 
-        x0, y0 = coords.min(axis=0)
-        x1, y1 = coords.max(axis=0)
-
-        bbox = [y0, x0, y1, x1]
-
-        copy = gt.copy()
-        copy[gt==pattern] = 255
-        copy[gt!=pattern] = 0
-        copy = np.asarray(copy,np.uint8)
-
-        contours, _ = cv2.findContours(copy, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-
-        contour = [np.reshape(contour,(contour.shape[0],2)) for contour in contours]
-        contour = np.asarray([item for tree in contour for item in tree])
-        px = contour[:,0]
-        py = contour[:,1]
-        poly = [(x + 0.5, y + 0.5) for x, y in zip(px, py)]
-        poly = [p for x in poly for p in x]
-
-        if len(poly) < 6:
-            continue
-
-
-        obj = {
-            "bbox": bbox,
-            "bbox_mode":BoxMode.XYXY_ABS,
-            "segmentation": [poly],
-            "category_id": map_classes[int(np.floor(gt[coords[0][0]][coords[0][1]]/1e3))],
-            "iscrowd": 0
-        }
-
-        objs.append(obj)
-
-    return objs
-
-
-def load_dataset(type, thing_classes, map_classes):
-    dataset_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/images'
-    }
-    gt_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/instances',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/instances'
-    }
-
-    with open('/home/group02/week3/data/split/kitti_mots_' + type + '.txt', 'r') as f:
-        lines = [line.rstrip() for line in f]
-
-    dataset_seqs = []
-    for l in lines:
-        dataset = l.split('datasets/')[1].split('/')[0]
-        seq = l.split('/')[-2]
-        dataset_seqs.append([dataset, seq])
-
-    dataset_dicts = []
-    for dataset, seq in dataset_seqs:
-        for j, img_name in enumerate(os.listdir(os.path.join(dataset_path[dataset], seq))):
-
-            if 'png' not in img_name and 'jpg' not in img_name:
-                continue
-
-            record = {}
-            filename = os.path.join(dataset_path[dataset], seq, img_name)
-            gt_filename = os.path.join(gt_path[dataset], seq, img_name.split('.')[0]+'.png')
-
-            gt = np.asarray(Image.open(gt_filename))
-
-            height, width = gt.shape[:]
-
-            record["file_name"] = filename
-            # record["image_id"] = i+j
-            record["image_id"] = filename
-            record["height"] = height
-            record["width"] = width
-
-            record["annotations"] = read_annotations(gt)
-            dataset_dicts.append(record)
-
-    return dataset_dicts
+    return load_cached(filepath, map_classes, mask_format=mask_format, num_workers=num_workers)
 
 
 def parse_args(args=sys.argv[1:]):
@@ -127,6 +45,13 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--output', type=str, default='/home/group02/week4/results/task_a',
                         help='output path to store the quantitative results')
 
+    parser.add_argument('--mask_format', type=str, default='polygon',
+                        choices=['polygon', 'bitmask'],
+                        help='store the ground truth masks as contour polygons or COCO RLE')
+
+    parser.add_argument('--load_workers', type=int, default=os.cpu_count(),
+                        help='processes used to parse the ground truth when it is not cached')
+
     return parser.parse_args(args)
 
 
@@ -151,7 +76,7 @@ if __name__ == "__main__":
     dataset='KITTI-MOTS'
 
     for d in ['train', 'test']:
-        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d,thing_classes,map_classes))
+        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d,thing_classes,map_classes,args.mask_format,args.load_workers))
         MetadataCatalog.get(dataset + '_' + d).set(thing_classes=thing_classes)
 
     metadata = MetadataCatalog.get(dataset + '_train')
@@ -159,6 +84,7 @@ if __name__ == "__main__":
     cfg.DATASETS.TRAIN = (dataset + '_train',)
     cfg.DATASETS.TEST = (dataset + '_test',)
     cfg.DATALOADER.NUM_WORKERS = 2
+    cfg.INPUT.MASK_FORMAT = args.mask_format
     cfg.MODEL.ROI_HEADS.NUM_CLASSES = len(thing_classes)
 
     trainer = DefaultTrainer(cfg)
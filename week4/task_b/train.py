@@ -5,7 +5,6 @@ from detectron2.utils.logger import setup_logger
 setup_logger()
 
 # import some common libraries
-import numpy as np
 import os, json, cv2, random, sys
 # import some common detectron2 utilities
 from detectron2 import model_zoo
@@ -14,108 +13,26 @@ from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures import BoxMode
 from detectron2.engine import DefaultTrainer
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
 from detectron2.data import build_detection_test_loader
 
 import argparse
-from PIL import Image
 
 from detectron2.modeling import build_model
 from detectron2.checkpoint import DetectionCheckpointer
 
-def read_annotations(gt):
-    patterns = list(np.unique(gt))[1:-1]
+sys.path.append('/home/group02/week3/code')
+from dataset_cache import load_cached
+from frame_writers import make_writer
+from inference_manifest import MANIFEST_NAME, InferenceManifest, config_hash
 
-    objs = []
-    for pattern in patterns:
-        coords = np.argwhere(gt==pattern)
+def load_dataset(type, use_motschallenge, thing_classes, map_classes, mask_format='polygon', num_workers=0):
+    filepath = '/home/group02/week4/data/split/kitti_mots_' + type + '.txt'
+    skip = [] if use_motschallenge else ['MOTSChallenge']
 
-        x0, y0 = coords.min(axis=0)
-        x1, y1 = coords.max(axis=0)
-
-        bbox = [y0, x0, y1, x1]
-
-        copy = gt.copy()
-        copy[gt==pattern] = 255
-        copy[gt!=pattern] = 0
-        copy = np.asarray(copy,np.uint8)
-
-        contours, _ = cv2.findContours(copy, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-
-        contour = [np.reshape(contour,(contour.shape[0],2)) for contour in contours]
-        contour = np.asarray([item for tree in contour for item in tree])
-        px = contour[:,0]
-        py = contour[:,1]
-        poly = [(x + 0.5, y + 0.5) for x, y in zip(px, py)]
-        poly = [p for x in poly for p in x]
-
-        if len(poly) < 6:
-            continue
-
-
-        obj = {
-            "bbox": bbox,
-            "bbox_mode":BoxMode.XYXY_ABS,
-            "segmentation": [poly],
-            "category_id": map_classes[int(np.floor(gt[coords[0][0]][coords[0][1]]/1e3))],
-            "iscrowd": 0
-        }
-
-        objs.append(obj)
-
-    return objs
-
-
-def load_dataset(type, use_motschallenge, thing_classes, map_classes):
-    dataset_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/images'
-    }
-    gt_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/instances',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/instances'
-    }
-
-    with open('/home/group02/week4/data/split/kitti_mots_' + type + '.txt', 'r') as f:
-        lines = [line.rstrip() for line in f]
-
-    dataset_seqs = []
-    for l in lines:
-        dataset = l.split('datasets/')[1].split('/')[0]
-        seq = l.split('/')[-2]
-        dataset_seqs.append([dataset, seq])
-
-    dataset_dicts = []
-    for dataset, seq in dataset_seqs:
-        if not use_motschallenge and dataset == 'MOTSChallenge':
-            continue
-
-        for j, img_name in enumerate(os.listdir(os.path.join(dataset_path[dataset], seq))):
-
-            if 'png' not in img_name and 'jpg' not in img_name:
-                continue
-
-            record = {}
-            filename = os.path.join(dataset_path[dataset], seq, img_name)
-            gt_filename = os.path.join(gt_path[dataset], seq, img_name.split('.')[0]+'.png')
-
-            gt = np.asarray(Image.open(gt_filename))
-
-            height, width = gt.shape[:]
-
-            record["file_name"] = filename
-            # record["image_id"] = i+j
-            record["image_id"] = filename
-            record["height"] = height
-            record["width"] = width
-
-            record["annotations"] = read_annotations(gt)
-            dataset_dicts.append(record)
-
-    return dataset_dicts
+    return load_cached(filepath, map_classes, mask_format=mask_format, skip=skip, num_workers=num_workers)
 
 
 def parse_args(args=sys.argv[1:]):
@@ -148,6 +65,28 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--batch', type=int, default=512,
                         help='batch size')
 
+    parser.add_argument('--mask_format', type=str, default='polygon',
+                        choices=['polygon', 'bitmask'],
+                        help='store the ground truth masks as contour polygons or COCO RLE')
+
+    parser.add_argument('--load_workers', type=int, default=os.cpu_count(),
+                        help='processes used to parse the ground truth when it is not cached')
+
+    parser.add_argument('--output_mode', type=str, default='images', choices=['images', 'video'],
+                        help='write one image per frame or one video per sequence')
+
+    parser.add_argument('--video_codec', type=str, default='mp4v', choices=['mp4v', 'avc1', 'MJPG'],
+                        help='codec of the video output mode')
+
+    parser.add_argument('--video_quality', type=int, default=None,
+                        help='quality (0-100) of the video output mode, for the codecs supporting it (MJPG)')
+
+    parser.add_argument('--stills', type=int, default=0,
+                        help='in video output mode, also write every n-th frame as an image, 0 for none')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the images already processed with the same configuration by a previous run')
+
     return parser.parse_args(args)
 
 
@@ -173,7 +112,7 @@ if __name__ == "__main__":
     dataset='KITTI-MOTS'
 
     for d in ['train', 'test']:
-        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d, args.use_motschallenge, thing_classes, map_classes))
+        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d, args.use_motschallenge, thing_classes, map_classes, args.mask_format, args.load_workers))
         MetadataCatalog.get(dataset + '_' + d).set(thing_classes=thing_classes)
 
     metadata = MetadataCatalog.get(dataset + '_train')
@@ -181,6 +120,7 @@ if __name__ == "__main__":
     cfg.DATASETS.TRAIN = (dataset + '_train',)
     cfg.DATASETS.TEST = (dataset + '_test',)
     cfg.DATALOADER.NUM_WORKERS = 2
+    cfg.INPUT.MASK_FORMAT = args.mask_format
     cfg.MODEL.ROI_HEADS.NUM_CLASSES = len(thing_classes)
     cfg.SOLVER.IMS_PER_BATCH = 2
 
@@ -209,16 +149,21 @@ if __name__ == "__main__":
 
     cfg.OUTPUT_DIR = os.path.join(cfg.OUTPUT_DIR, args.seq)
     os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
+    manifest = InferenceManifest(os.path.join(cfg.OUTPUT_DIR, MANIFEST_NAME),
+                                 config_hash(cfg, output_mode=args.output_mode), args.resume)
 
     for subdir, dirs, files in os.walk(os.path.join(args.data, args.seq)):
-        for file in files:
-            input_path = os.path.join(subdir, file)
-            output_path = os.path.join(cfg.OUTPUT_DIR, file)
-
+        frame_paths = [os.path.join(cfg.OUTPUT_DIR, file) for file in sorted(files)]
+        writer = make_writer(args.output_mode, cfg.OUTPUT_DIR, args.seq, frame_paths,
+                             args.video_codec, args.video_quality, args.stills, manifest)
+        jobs = [(os.path.join(subdir, file), os.path.join(cfg.OUTPUT_DIR, file)) for file in sorted(files)]
+        for input_path, output_path in manifest.pending(jobs, whole=args.output_mode == 'video'):
             im = cv2.imread(input_path)
             outputs = predictor(im)
 
             # We can use `Visualizer` to draw the predictions on the image.
             v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(cfg.DATASETS.TRAIN[0]), scale=1.2)
             out = v.draw_instance_predictions(outputs["instances"].to("cpu"))
-            cv2.imwrite(output_path, out.get_image()[:, :, ::-1])
+            writer(output_path, out.get_image()[:, :, ::-1])
+        writer.close()
+    manifest.close()
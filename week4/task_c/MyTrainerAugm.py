@@ -6,7 +6,7 @@ setup_logger()
 
 # import some common libraries
 import numpy as np
-import os, json, cv2, random
+import os, json, cv2, random, sys
 # import some common detectron2 utilities
 from detectron2 import model_zoo
 from detectron2.engine import DefaultPredictor
@@ -20,10 +20,12 @@ from detectron2.data import transforms as T
 from detectron2.data import detection_utils as utils
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
-from detectron2.data import build_detection_train_loader, build_detection_test_loader
+from detectron2.data import build_detection_train_loader
 
 import copy
+sys.path.append('/home/group02/week3/code')
 from LossEvalHook import *
+from ProfilerHook import build_profiler_hook
 
 from detectron2.data import DatasetMapper
 
@@ -44,15 +46,11 @@ class MyTrainerAugm(DefaultTrainer):
 
     def build_hooks(self):
         hooks = super().build_hooks()
-        hooks.insert(-1,LossEvalHook(
-            self.cfg.TEST.EVAL_PERIOD,
-            self.model,
-            build_detection_test_loader(
-                self.cfg,
-                self.cfg.DATASETS.TEST[0],
-                DatasetMapper(self.cfg,True)
-            )
-        ))
+        hooks.insert(-1, build_loss_eval_hook(self.cfg, self.model))
+        profiler = build_profiler_hook(self.cfg, self.model)
+        if profiler is not None:
+            # first, so that the time of the other hooks is not in the profiled step
+            hooks.insert(0, profiler)
         return hooks
 
 
@@ -65,13 +63,9 @@ class MyTrainer(DefaultTrainer):
 
     def build_hooks(self):
         hooks = super().build_hooks()
-        hooks.insert(-1,LossEvalHook(
-            self.cfg.TEST.EVAL_PERIOD,
-            self.model,
-            build_detection_test_loader(
-                self.cfg,
-                self.cfg.DATASETS.TEST[0],
-                DatasetMapper(self.cfg,True)
-            )
-        ))
+        hooks.insert(-1, build_loss_eval_hook(self.cfg, self.model))
+        profiler = build_profiler_hook(self.cfg, self.model)
+        if profiler is not None:
+            # first, so that the time of the other hooks is not in the profiled step
+            hooks.insert(0, profiler)
         return hooks
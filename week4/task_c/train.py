@@ -5,8 +5,7 @@ from detectron2.utils.logger import setup_logger
 setup_logger()
 
 # import some common libraries
-import numpy as np
-import os, json, cv2, random, sys
+import os, json, random, sys
 # import some common detectron2 utilities
 from detectron2 import model_zoo
 from detectron2.engine import DefaultPredictor
@@ -14,109 +13,27 @@ from detectron2.config import get_cfg
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog, DatasetCatalog
 
-from detectron2.structures import BoxMode
 from detectron2.engine import DefaultTrainer
 
 from detectron2.evaluation import COCOEvaluator, inference_on_dataset
 from detectron2.data import build_detection_test_loader
 
 import argparse
-from PIL import Image
 
 from detectron2.modeling import build_model
 from detectron2.checkpoint import DetectionCheckpointer
 
+sys.path.append('/home/group02/week3/code')
+from dataset_cache import load_cached
+
 from LossEvalHook import *
 from MyTrainerAugm import *
 
-def read_annotations(gt):
-    patterns = list(np.unique(gt))[1:-1]
-
-    objs = []
-    for pattern in patterns:
-        coords = np.argwhere(gt==pattern)
-
-        x0, y0 = coords.min(axis=0)
-        x1, y1 = coords.max(axis=0)
-
-        bbox = [y0, x0, y1, x1]
-
-        copy = gt.copy()
-        copy[gt==pattern] = 255
-        copy[gt!=pattern] = 0
-        copy = np.asarray(copy,np.uint8)
-
-        contours, _ = cv2.findContours(copy, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-
-        contour = [np.reshape(contour,(contour.shape[0],2)) for contour in contours]
-        contour = np.asarray([item for tree in contour for item in tree])
-        px = contour[:,0]
-        py = contour[:,1]
-        poly = [(x + 0.5, y + 0.5) for x, y in zip(px, py)]
-        poly = [p for x in poly for p in x]
-
-        if len(poly) < 6:
-            continue
-
-
-        obj = {
-            "bbox": bbox,
-            "bbox_mode":BoxMode.XYXY_ABS,
-            "segmentation": [poly],
-            "category_id": map_classes[int(np.floor(gt[coords[0][0]][coords[0][1]]/1e3))],
-            "iscrowd": 0
-        }
-
-        objs.append(obj)
-
-    return objs
-
-def load_dataset(type, thing_classes, map_classes):
-    dataset_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/training/image_02',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/images'
-    }
-    gt_path = {
-        'KITTI-MOTS' : '/home/group02/mcv/datasets/KITTI-MOTS/instances',
-        'MOTSChallenge' : '/home/group02/mcv/datasets/MOTSChallenge/train/instances'
-    }
-
-    with open('/home/group02/week4/data/split/kitti_mots_' + type + '.txt', 'r') as f:
-        lines = [line.rstrip() for line in f]
+def load_dataset(type, thing_classes, map_classes, mask_format='polygon', num_workers=0):
+    filepath = '/home/group02/week4/data/split/kitti_mots_' + type + '.txt'
 
-    dataset_seqs = []
-    for l in lines:
-        dataset = l.split('datasets/')[1].split('/')[0]
-        seq = l.split('/')[-2]
-        dataset_seqs.append([dataset, seq])
+    return load_cached(filepath, map_classes, mask_format=mask_format, skip=['MOTSChallenge'], num_workers=num_workers)
 
-    dataset_dicts = []
-    for dataset, seq in dataset_seqs:
-        if dataset == 'MOTSChallenge':
-            continue
-        for j, img_name in enumerate(os.listdir(os.path.join(dataset_path[dataset], seq))):
-
-            if 'png' not in img_name and 'jpg' not in img_name:
-                continue
-
-            record = {}
-            filename = os.path.join(dataset_path[dataset], seq, img_name)
-            gt_filename = os.path.join(gt_path[dataset], seq, img_name.split('.')[0]+'.png')
-
-            gt = np.asarray(Image.open(gt_filename))
-
-            height, width = gt.shape[:]
-
-            record["file_name"] = filename
-            # record["image_id"] = i+j
-            record["image_id"] = filename
-            record["height"] = height
-            record["width"] = width
-
-            record["annotations"] = read_annotations(gt)
-            dataset_dicts.append(record)
-
-    return dataset_dicts
 
 def parse_args(args=sys.argv[1:]):
     parser = argparse.ArgumentParser()
@@ -148,6 +65,28 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--nms', type=float, default='0.7',
                         help='threshold for non-maximum suppression')
 
+    parser.add_argument('--mask_format', type=str, default='polygon',
+                        choices=['polygon', 'bitmask'],
+                        help='store the ground truth masks as contour polygons or COCO RLE')
+
+    parser.add_argument('--eval_period', type=int, default=0,
+                        help='compute the validation loss every this many iterations, 0 for only at the end')
+
+    parser.add_argument('--loss_eval_images', type=int, default=200,
+                        help='random images the validation loss is computed on, 0 for all of them')
+
+    parser.add_argument('--loss_eval_async', action='store_true',
+                        help='compute the validation loss in a separate process on a copy of the weights')
+
+    parser.add_argument('--loss_eval_cache_mb', type=int, default=2048,
+                        help='MB of mapped validation images kept in RAM for the validation loss, 0 to disable')
+
+    parser.add_argument('--profile', type=int, default=0,
+                        help='profile the model stages every this many iterations, 0 to disable')
+
+    parser.add_argument('--load_workers', type=int, default=os.cpu_count(),
+                        help='processes used to parse the ground truth when it is not cached')
+
     return parser.parse_args(args)
 
 
@@ -173,7 +112,7 @@ if __name__ == "__main__":
     dataset='KITTI-MOTS'
 
     for d in ['train', 'test']:
-        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d, thing_classes, map_classes))
+        DatasetCatalog.register(dataset + '_' + d, lambda d=d: load_dataset(d, thing_classes, map_classes, args.mask_format, args.load_workers))
         MetadataCatalog.get(dataset + '_' + d).set(thing_classes=thing_classes)
 
     metadata = MetadataCatalog.get(dataset + '_train')
@@ -181,6 +120,7 @@ if __name__ == "__main__":
     cfg.DATASETS.TRAIN = (dataset + '_train',)
     cfg.DATASETS.TEST = (dataset + '_test',)
     cfg.DATALOADER.NUM_WORKERS = 2
+    cfg.INPUT.MASK_FORMAT = args.mask_format
     cfg.MODEL.ROI_HEADS.NUM_CLASSES = len(thing_classes)
     cfg.SOLVER.IMS_PER_BATCH = 2
 
@@ -203,10 +143,13 @@ if __name__ == "__main__":
 
     cfg.MODEL.ROI_HEADS.BATCH_SIZE_PER_IMAGE = args.batch
 
-    # CAUTION!!! If you set this to a value different of 0, the training stage takes a really long
-    # time. We should check how to plot train and validation loss curves properly
-    # ALSO, I THINK this computes the TEST loss (not validation loss), so it's better to SET IT TO 0
-    cfg.TEST.EVAL_PERIOD = 0  # frequence of validation loss computations (to plot curves)
+    # The loss is computed on DATASETS.TEST (the test split here), on a fixed random subset of
+    # --loss_eval_images images, and in its own process with --loss_eval_async
+    cfg.TEST.EVAL_PERIOD = args.eval_period  # frequence of validation loss computations (to plot curves)
+    cfg.TEST.LOSS_EVAL_IMAGES = args.loss_eval_images
+    cfg.TEST.LOSS_EVAL_ASYNC = args.loss_eval_async
+    cfg.TEST.LOSS_EVAL_CACHE_MB = args.loss_eval_cache_mb
+    cfg.TEST.PROFILE_PERIOD = args.profile  # ProfilerHook, time and memory of the model stages
 
     if args.augm:
         trainer = MyTrainerAugm(cfg)
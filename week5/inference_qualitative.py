@@ -1,4 +1,4 @@
-import sys, os, cv2
+import sys, os
 import torch
 assert torch.__version__.startswith("1.7")
 from detectron2.utils.logger import setup_logger
@@ -6,13 +6,17 @@ setup_logger()
 
 # import some common detectron2 utilities
 from detectron2 import model_zoo
-from detectron2.engine import DefaultPredictor
 from detectron2.config import get_cfg
-from detectron2.utils.visualizer import Visualizer
-from detectron2.data import MetadataCatalog, DatasetCatalog
 
 import argparse
 
+sys.path.append('/home/group02/week3/code')
+from batch_predictor import BatchPredictor
+from frame_writers import make_writer
+from inference_manifest import MANIFEST_NAME, InferenceManifest, config_hash
+from prediction_store import PredictionWriter
+from inference_pipeline import RENDERERS, InferencePipeline
+
 models = {
     'faster': 'COCO-Detection/faster_rcnn_X_101_32x8d_FPN_3x.yaml',
     'mask': 'COCO-InstanceSegmentation/mask_rcnn_X_101_32x8d_FPN_3x.yaml'
@@ -31,6 +35,30 @@ def parse_args(args=sys.argv[1:]):
     parser.add_argument('--output', type=str, default='./results/task_a',
                         help='output path to store the qualitative results')
 
+    parser.add_argument('--batch_size', '--batch-size', type=int, default=1,
+                        help='number of images of the same size given to the model at once')
+
+    parser.add_argument('--queue_size', type=int, default=8,
+                        help='maximum number of images waiting between two pipeline stages')
+
+    parser.add_argument('--render_workers', type=int, default=2,
+                        help='threads drawing the predictions')
+
+    parser.add_argument('--render_processes', type=int, default=0,
+                        help='processes drawing the predictions, 0 to draw in the render threads')
+
+    parser.add_argument('--renderer', type=str, default='visualizer', choices=['visualizer', 'fast'],
+                        help="detectron2's Visualizer or the faster OpenCV drawing of fast_renderer.py")
+
+    parser.add_argument('--output_mode', type=str, default='images', choices=['images', 'none'],
+                        help="write one image per input image, or nothing ('none', only useful with --dump)")
+
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the images already processed with the same configuration by a previous run')
+
+    parser.add_argument('--dump', action='store_true',
+                        help='also store the raw predictions (boxes, scores, classes, RLE masks) in <output>/predictions')
+
     return parser.parse_args(args)
 
 if __name__ == '__main__':
@@ -45,20 +73,34 @@ if __name__ == '__main__':
     cfg.merge_from_file(model_zoo.get_config_file(model_path))
     cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
     cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(model_path)
-    predictor = DefaultPredictor(cfg)
+    predictor = BatchPredictor(cfg, args.batch_size)
 
     cfg.OUTPUT_DIR = os.path.join(args.output, args.model)
     os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
 
-    for subdir, dirs, files in os.walk(args.data):
-        for file in files:
-            input_path = os.path.join(subdir, file)
-            output_path = os.path.join(cfg.OUTPUT_DIR, file)
-
-            im = cv2.imread(input_path)
-            outputs = predictor(im)
+    manifest = InferenceManifest(os.path.join(cfg.OUTPUT_DIR, MANIFEST_NAME),
+                                 config_hash(cfg, renderer=args.renderer, output_mode=args.output_mode, dump=args.dump),
+                                 args.resume)
 
-            # We can use `Visualizer` to draw the predictions on the image.
-            v = Visualizer(im[:, :, ::-1], MetadataCatalog.get(cfg.DATASETS.TRAIN[0]), scale=1.2)
-            out = v.draw_instance_predictions(outputs["instances"].to("cpu"))
-            cv2.imwrite(output_path, out.get_image()[:, :, ::-1])
+    # decode, inference, drawing and writing of the images run concurrently
+    render = RENDERERS[args.renderer](cfg.DATASETS.TRAIN[0]) if args.output_mode != 'none' else None
+    for subdir, dirs, files in os.walk(args.data):
+        if not files:
+            continue
+        # one shard per folder, named after its path under --data so that folders with the same name do not collide
+        shard = os.path.relpath(subdir, args.data)
+        shard = os.path.basename(os.path.normpath(args.data)) if shard == '.' else shard.replace(os.sep, '_')
+        # when dumping, the manifest follows the shard of predictions of the folder, written at the end
+        dump = PredictionWriter(os.path.join(cfg.OUTPUT_DIR, 'predictions'), shard, args.resume,
+                                manifest, manifest.config_hash) if args.dump else None
+        writer = make_writer(args.output_mode, cfg.OUTPUT_DIR, shard, [], manifest=None if args.dump else manifest)
+        pipeline = InferencePipeline(predictor, render, writer,
+                                     batch_size=args.batch_size, queue_size=args.queue_size,
+                                     render_workers=args.render_workers, render_processes=args.render_processes,
+                                     dump=dump)
+        jobs = [(os.path.join(subdir, file), os.path.join(cfg.OUTPUT_DIR, file)) for file in files]
+        pipeline.run(manifest.pending(jobs))
+        writer.close()
+        if dump is not None:
+            dump.close()
+    manifest.close()